@@ -0,0 +1,494 @@
+""" headless batch runner: solve the models for a file of scenarios in a process pool
+
+run as: python batch_runner.py scenarios.json results [--workers N] [--timeout SECONDS] [--format auto|parquet|csv]
+
+The scenario file is a JSON list (or one JSON object per line) of scenarios such as
+
+    {"name": "household", "model": "household", "task": "solve_discrete", "params": {"sigma": 0.5},
+     "grid": {"alpha": [0.25, 0.5, 0.75], "wF": [0.8, 1.0, 1.2]}, "timeout": 60}
+
+where grid is expanded to all combinations, which are added to params. The models and their tasks
+are listed in TASKS. Each scenario is identified by a hash of its model, task and params.
+
+Results are written incrementally to part files in results/<model>.<task>/, one row per scenario with
+its id, name, status ('ok', 'error' or 'timeout'), error message, wall time, the params (prefixed
+param.) and the results. Running again with the same results folder skips the scenarios already
+recorded, so an interrupted sweep can be resumed (with --retry-failed errors and timeouts are rerun).
+Parts are Parquet files if pyarrow or fastparquet is installed and CSV files otherwise.
+"""
+
+import argparse
+import hashlib
+import importlib
+import importlib.util
+import itertools
+import json
+import math
+import os
+import signal
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+#############
+# tasks #
+#############
+
+def _import(folder, module):
+    """ import a project module, which imports its siblings by name """
+
+    path = os.path.join(ROOT, folder)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+    return importlib.import_module(module)
+
+def _household(method):
+    """ task calling a method of the household model, params in par are set and the rest passed to the method """
+
+    def task(**params):
+        import numpy as np
+        model = _import('inauguralproject', 'HouseholdSpecializationModel').HouseholdSpecializationModelClass()
+
+        kwargs = {}
+        for k,v in params.items():
+            if hasattr(model.par, k):
+                setattr(model.par, k, np.array(v) if isinstance(v, list) else v)
+            else:
+                kwargs[k] = v
+
+        if method == 'solve_wF_vec':
+            model.solve_wF_vec(**kwargs)
+            model.run_regression()
+            return dict(beta0=model.sol.beta0, beta1=model.sol.beta1,
+                        **{k:getattr(model.sol, k) for k in ('LM_vec','HM_vec','LF_vec','HF_vec')})
+
+        opt = getattr(model, method)(**kwargs)
+
+        return vars(opt)
+
+    return task
+
+def _stackelberg(c, d, n, method='analytic'):
+    model = _import('modelproject', 'Stackelberg').StackelbergDuopoly(c=c, d=d, n=n)
+    q1, q2 = model.get_optimal_quantities(method=method)
+    return dict(q_follower=q1, q_leader=q2, profit_follower=model.profit_f(q1, q2), profit_leader=model.profit_l(q1, q2))
+
+def _salon_ex_ante_value(**params):
+    return dict(H=_import('examproject', 'salon').ex_ante_value(**params))
+
+def _salon_optimize_delta(**params):
+    res = _import('examproject', 'salon').optimize_delta(**params)
+    return dict(delta=res.delta, H=res.H, se=res.se, N=res.N, nfev=res.nfev)
+
+def _salon_compare_bellman_delta(**params):
+    res = _import('examproject', 'salon').compare_bellman_delta(**params)
+    return dict(H_bellman=res.H_bellman, se_bellman=res.se_bellman, it=res.bellman.it, time_bellman=res.time_bellman,
+                delta=res.delta.delta, H_delta=res.delta.H, se_delta=res.delta.se, time_delta=res.time_delta)
+
+def _multistart(objective='griewank', n=2, bounds=None, **params):
+    multistart = _import('examproject', 'multistart')
+    func, grad, default_bounds, f_min = multistart.OBJECTIVES[objective]
+    params.setdefault('f_target', f_min)
+    res = multistart.multistart(func, default_bounds if bounds is None else bounds, grad=grad, n=n, **params)
+    return dict(x_star=res.x_star, f_star=res.f_star, k=res.k, nfev=res.nfev, njev=res.njev, converged=res.converged)
+
+# (model, task): function of the scenario params returning a dict of results
+TASKS = {
+    ('household', 'solve_discrete'): _household('solve_discrete'),
+    ('household', 'solve'): _household('solve'),
+    ('household', 'solve_wF_vec'): _household('solve_wF_vec'),
+    ('household', 'estimate'): _household('estimate'),
+    ('stackelberg', 'get_optimal_quantities'): _stackelberg,
+    ('salon', 'ex_ante_value'): _salon_ex_ante_value,
+    ('salon', 'optimize_delta'): _salon_optimize_delta,
+    ('salon', 'compare_bellman_delta'): _salon_compare_bellman_delta,
+    ('multistart', 'multistart'): _multistart,
+}
+
+# modules of each model, imported before the timer starts as an interrupted import leaves a broken module
+MODULES = {
+    'household': [('inauguralproject', 'HouseholdSpecializationModel')],
+    'stackelberg': [('modelproject', 'Stackelberg')],
+    'salon': [('examproject', 'salon')],
+    'multistart': [('examproject', 'multistart')],
+}
+
+#################
+# scenarios #
+#################
+
+def scenario_id(model, task, params):
+    """ hash of the scenario, independent of its position in the file and the order of params """
+
+    text = json.dumps([model, task, params], sort_keys=True, default=str)
+    return hashlib.sha1(text.encode()).hexdigest()[:16]
+
+def read_scenarios(path, timeout=None):
+    """Read a scenario file and expand the grids
+
+    Returns
+    -------
+    list
+        One dict per scenario with id, name, model, task, params and timeout
+    """
+    with open(path) as f:
+        text = f.read()
+
+    if path.endswith('.jsonl'):
+        entries = [json.loads(line) for line in text.splitlines() if line.strip()]
+    else:
+        entries = json.loads(text)
+        if isinstance(entries, dict):
+            entries = entries['scenarios']
+
+    scenarios = []
+    for entry in entries:
+
+        model, task = entry['model'], entry['task']
+        if (model, task) not in TASKS:
+            raise ValueError(f'unknown task {task} for model {model}')
+
+        grid = entry.get('grid', {})
+        for values in itertools.product(*grid.values()):
+            params = {**entry.get('params', {}), **dict(zip(grid, values))}
+            scenarios.append(dict(id=scenario_id(model, task, params), name=entry.get('name', model), model=model,
+                                  task=task, params=params, timeout=entry.get('timeout', timeout)))
+
+    return scenarios
+
+#################
+# execution #
+#################
+
+class TaskTimeout(BaseException):
+    """ raised in a task when its time is up, a BaseException so that the models do not catch it """
+
+def _alarm(signum, frame):
+    raise TaskTimeout()
+
+def _to_builtin(value):
+    """ numpy scalars as python scalars and arrays as JSON text, so every result fits in a column """
+
+    if hasattr(value, 'tolist'):
+        value = value.tolist()
+    if isinstance(value, (list, tuple, dict)):
+        return json.dumps(value)
+    return value
+
+def _row(scenario, status='ok', error=''):
+    """ the columns identifying a scenario """
+
+    row = dict(id=scenario['id'], name=scenario['name'], model=scenario['model'], task=scenario['task'],
+               status=status, error=error, time=0.0)
+    row.update({f'param.{k}':_to_builtin(v) for k,v in scenario['params'].items()})
+
+    return row
+
+def run_scenario(scenario):
+    """Run one scenario, stopped by SIGALRM after its timeout
+
+    The timeout interrupts python code, a single long call into compiled code finishes first (run_batch
+    then stops the worker). The modules in MODULES are imported before the timer starts.
+
+    Returns
+    -------
+    dict
+        The row of results
+    """
+    row = _row(scenario)
+    timeout = scenario.get('timeout')
+    previous = signal.getsignal(signal.SIGALRM)
+
+    t0 = time.perf_counter()
+    try:
+        for folder,module in MODULES.get(scenario['model'], []):
+            _import(folder, module)
+    except Exception as e:
+        row['status'], row['error'] = 'error', f'{type(e).__name__}: {e}'
+        return row
+
+    try:
+        if timeout:
+            signal.signal(signal.SIGALRM, _alarm)
+            signal.setitimer(signal.ITIMER_REAL, timeout)
+        try:
+            results = TASKS[scenario['model'], scenario['task']](**scenario['params'])
+            row.update({k:_to_builtin(v) for k,v in results.items()})
+        except Exception as e:
+            row['status'], row['error'] = 'error', f'{type(e).__name__}: {e}'
+        finally:
+            _disarm()
+    except TaskTimeout: # the timer goes off once, so this is reached at most once
+        row['status'], row['error'] = 'timeout', f'no result after {timeout} s'
+    signal.signal(signal.SIGALRM, previous)
+    row['time'] = time.perf_counter()-t0
+
+    return row
+
+def _disarm():
+    """ stop the timer, also if it goes off meanwhile """
+
+    while True:
+        try:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            return
+        except TaskTimeout:
+            pass
+
+##############
+# output #
+##############
+
+def _default_format():
+    if any(importlib.util.find_spec(engine) is not None for engine in ('pyarrow', 'fastparquet')):
+        return 'parquet'
+    return 'csv'
+
+def _parts(folder):
+    """ part files of a results folder """
+
+    parts = []
+    for sub in sorted(os.listdir(folder)) if os.path.isdir(folder) else []:
+        path = os.path.join(folder, sub)
+        if os.path.isdir(path):
+            parts += [os.path.join(path, f) for f in sorted(os.listdir(path)) if f.startswith('part-') and not f.endswith('.tmp')]
+
+    return parts
+
+def _read_part(path, columns=None):
+    import pandas as pd
+
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path, columns=columns)
+    return pd.read_csv(path, usecols=columns)
+
+def read_results(folder, model=None, task=None, latest=True):
+    """ rows written to folder, optionally for one model and task, with latest only the last row of each scenario """
+
+    import pandas as pd
+
+    parts = [path for path in _parts(folder)
+             if (model is None or os.path.basename(os.path.dirname(path)).split('.')[0] == model)
+             and (task is None or os.path.basename(os.path.dirname(path)).split('.')[1] == task)]
+    if not parts:
+        return pd.DataFrame()
+
+    df = pd.concat([_read_part(path) for path in parts], ignore_index=True)
+    if latest:
+        df = df.drop_duplicates('id', keep='last').reset_index(drop=True) # parts are numbered in the order written
+
+    return df
+
+def completed_ids(folder, retry_failed=False):
+    """ ids of the scenarios already recorded in folder (only those that succeeded with retry_failed) """
+
+    done = set()
+    for path in _parts(folder):
+        rows = _read_part(path, columns=['id', 'status'])
+        done.update(rows['id'] if not retry_failed else rows['id'][rows['status'] == 'ok'])
+
+    return done
+
+class PartWriter:
+    """ buffer rows for each model and task and write them as numbered part files """
+
+    def __init__(self, folder, fmt='parquet', flush_rows=1000, flush_seconds=60.0):
+
+        self.folder = folder
+        self.fmt = fmt
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+
+        self.buffers = {}
+        self.size = 0
+        self.last_flush = time.perf_counter()
+
+    def add(self, row):
+
+        self.buffers.setdefault(f'{row["model"]}.{row["task"]}', []).append(row)
+        self.size += 1
+        if self.size >= self.flush_rows or time.perf_counter()-self.last_flush > self.flush_seconds:
+            self.flush()
+
+    def flush(self):
+        import pandas as pd
+
+        for key,rows in self.buffers.items():
+
+            if not rows: continue
+            folder = os.path.join(self.folder, key)
+            os.makedirs(folder, exist_ok=True)
+
+            # written under a temporary name and renamed, so a part is either complete or absent
+            path = os.path.join(folder, f'part-{len(os.listdir(folder)):05d}.{self.fmt}')
+            tmp = path + '.tmp'
+            df = pd.DataFrame(rows)
+            if self.fmt == 'parquet':
+                df.to_parquet(tmp, index=False)
+            else:
+                df.to_csv(tmp, index=False)
+            os.replace(tmp, path)
+
+        self.buffers = {}
+        self.size = 0
+        self.last_flush = time.perf_counter()
+
+def _kill(pool):
+    """ kill the worker processes of a pool, its futures then fail with BrokenProcessPool """
+
+    for process in list((pool._processes or {}).values()):
+        process.kill()
+
+def run_batch(scenarios, folder, workers=None, fmt=None, resume=True, retry_failed=False, flush_rows=1000,
+              flush_seconds=60.0, grace=2.0, do_print=True):
+    """Run the scenarios in a process pool and write the results to folder
+
+    At most 4*workers scenarios are submitted at a time, so the queue of futures stays small for long
+    sweeps. If a worker crashes, all submitted scenarios fail together and it is not known which one caused
+    it, so the pool is restarted and they are rerun one at a time: a scenario is recorded as an error only if
+    it breaks the pool when running alone. A scenario still running grace seconds after its timeout (e.g. in
+    a long call into compiled code) is recorded as a timeout, the pool is killed and restarted, and the other
+    running scenarios are resubmitted. The timeout is counted from submission, so with timeouts only workers
+    scenarios are submitted at a time. With workers=1 the scenarios are run in this process and only the
+    timer in run_scenario applies.
+
+    Returns
+    -------
+    dict
+        Number of scenarios for each status and of those skipped as already recorded
+    """
+    workers = os.cpu_count() if workers is None else workers
+    fmt = _default_format() if fmt is None else fmt
+
+    # a. skip the scenarios already recorded
+    done = completed_ids(folder, retry_failed) if resume else set()
+    todo = [scenario for scenario in scenarios if scenario['id'] not in done]
+    todo = list({scenario['id']:scenario for scenario in todo}.values()) # duplicates in the file are run once
+    counts = dict(ok=0, error=0, timeout=0, skipped=len(scenarios)-len(todo))
+
+    writer = PartWriter(folder, fmt, flush_rows, flush_seconds)
+    t0 = time.perf_counter()
+
+    def record(row):
+        writer.add(row)
+        counts[row['status']] += 1
+        n = sum(counts[k] for k in ('ok','error','timeout'))
+        if do_print and (n % max(len(todo)//20, 1) == 0 or n == len(todo)):
+            print(f'{n:8d}/{len(todo)} scenarios {time.perf_counter()-t0:9.1f} s  ok {counts["ok"]}, error {counts["error"]}, timeout {counts["timeout"]}', flush=True)
+
+    # b. run
+    try:
+
+        if workers <= 1:
+            for scenario in todo:
+                record(run_scenario(scenario))
+            return counts
+
+        queue = iter(todo)
+        limit = workers if any(scenario.get('timeout') for scenario in todo) else 4*workers
+        pool = ProcessPoolExecutor(workers)
+        running = {}
+        submitted = {}
+        suspects = [] # submitted when the pool broke, run one at a time
+        try:
+            while True:
+
+                if suspects:
+                    new = [suspects.pop(0)] if not running else []
+                else:
+                    new = itertools.islice(queue, limit-len(running))
+                for scenario in new:
+                    future = pool.submit(run_scenario, scenario)
+                    running[future] = scenario
+                    submitted[future] = time.perf_counter()
+                if not running: break
+
+                deadline = min(submitted[future]+(running[future].get('timeout') or math.inf)+grace for future in running)
+                timeout = None if deadline == math.inf else max(deadline-time.perf_counter(), 0)
+                alone = len(running) == 1
+                finished, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+                broken = False
+                for future in finished:
+                    scenario = running.pop(future)
+                    del submitted[future]
+                    try:
+                        record(future.result())
+                    except BrokenProcessPool as e:
+                        broken = True
+                        if alone:
+                            record(_row(scenario, status='error', error=f'{type(e).__name__}: {e}'))
+                        else:
+                            suspects.append(scenario)
+
+                # stop the scenarios past their deadline
+                now = time.perf_counter()
+                overdue = [future for future in running if now > submitted[future]+(running[future].get('timeout') or math.inf)+grace]
+                for future in overdue:
+                    scenario = running.pop(future)
+                    row = _row(scenario, status='timeout', error=f'no result after {scenario["timeout"]} s, worker stopped')
+                    row['time'] = now-submitted.pop(future)
+                    record(row)
+                if overdue:
+                    _kill(pool)
+
+                if broken or overdue:
+                    pool.shutdown(cancel_futures=True)
+                    pool = ProcessPoolExecutor(workers)
+                    resubmit = []
+                    for future,scenario in running.items():
+                        if future.done() and not future.cancelled() and future.exception() is None:
+                            record(future.result()) # finished before the pool stopped
+                        else:
+                            resubmit.append(scenario)
+                    if broken:
+                        suspects += resubmit
+                    else:
+                        queue = itertools.chain(resubmit, queue)
+                    running = {}
+                    submitted = {}
+
+        finally:
+            pool.shutdown(cancel_futures=True)
+
+    finally:
+        writer.flush() # also on errors and interrupts, so the run can be resumed
+
+    return counts
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('scenarios', help='scenario file (.json or .jsonl)')
+    parser.add_argument('results', help='folder for the part files')
+    parser.add_argument('--workers', type=int, default=None, help='number of processes (default: all cores)')
+    parser.add_argument('--timeout', type=float, default=None, help='default timeout per scenario in seconds')
+    parser.add_argument('--format', choices=['auto','parquet','csv'], default='auto', help='format of the part files')
+    parser.add_argument('--no-resume', action='store_true', help='run all scenarios, also those already recorded (rows are added)')
+    parser.add_argument('--retry-failed', action='store_true', help='rerun scenarios recorded with an error or timeout')
+    parser.add_argument('--flush-rows', type=int, default=1000, help='rows buffered before a part is written')
+    parser.add_argument('--flush-seconds', type=float, default=60.0, help='seconds between parts')
+    parser.add_argument('--grace', type=float, default=2.0, help='seconds past its timeout before a scenario\'s worker is killed')
+    parser.add_argument('--quiet', action='store_true')
+    args = parser.parse_args(argv)
+
+    # one thread per process, set before numpy is imported
+    if args.workers is None or args.workers > 1:
+        for var in ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS'):
+            os.environ.setdefault(var, '1')
+
+    scenarios = read_scenarios(args.scenarios, timeout=args.timeout)
+    counts = run_batch(scenarios, args.results, workers=args.workers, fmt=None if args.format == 'auto' else args.format,
+                       resume=not args.no_resume, retry_failed=args.retry_failed, flush_rows=args.flush_rows,
+                       flush_seconds=args.flush_seconds, grace=args.grace, do_print=not args.quiet)
+
+    if not args.quiet:
+        print(', '.join(f'{k} {v}' for k,v in counts.items()))
+
+    return 0 if counts['error'] == 0 and counts['timeout'] == 0 else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
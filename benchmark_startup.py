@@ -0,0 +1,65 @@
+""" startup benchmark: time and memory of importing each project module in a fresh interpreter
+
+run as: python benchmark_startup.py [repeats]
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# (folder, module)
+MODULES = [
+    ('inauguralproject', 'HouseholdSpecializationModel'),
+    ('modelproject', 'Stackelberg'),
+    ('dataproject', 'dataproject'),
+    ('examproject', 'salon'),
+    ('examproject', 'problem2_q2'),
+    ('examproject', 'problem2_q3'),
+    ('examproject', 'problem2_q4'),
+    ('examproject', 'multistart'),
+    ('examproject', 'problem3_q1_q2'),
+]
+
+# packages that should only be imported when plotting, using widgets or a compiled backend
+HEAVY = ['pandas', 'matplotlib', 'ipywidgets', 'IPython', 'matplotlib_venn', 'statsmodels', 'sympy', 'numba']
+
+# measured in the child process, baseline is the interpreter itself
+CODE = """
+import json, resource, sys, time
+rss0 = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+t0 = time.perf_counter()
+{statement}
+t = time.perf_counter() - t0
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps(dict(time=t, rss0=rss0, rss=rss, heavy=[m for m in {heavy} if m in sys.modules])))
+"""
+
+def measure(folder, module, repeats=3):
+    """ best import time and the resident memory after import over repeats fresh interpreters """
+
+    statement = f'import {module}' if module is not None else 'pass'
+    results = []
+    for _ in range(repeats):
+        out = subprocess.run([sys.executable, '-c', CODE.format(statement=statement, heavy=HEAVY)],
+                             cwd=os.path.join(ROOT, folder), capture_output=True, text=True, check=True)
+        results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    best = min(results, key=lambda r: r['time'])
+    best['rss_mb'] = best['rss'] / 1024 # ru_maxrss is in kB on linux
+    best['delta_rss_mb'] = (best['rss'] - best['rss0']) / 1024
+
+    return best
+
+def run(repeats=3):
+
+    print(f'{"module":>32s} {"time [ms]":>10s} {"rss [MB]":>9s} {"+rss [MB]":>10s}  heavy imports')
+    for folder, module in [('.', None)] + MODULES:
+        res = measure(folder, module, repeats)
+        name = 'python' if module is None else f'{folder}/{module}'
+        print(f'{name:>32s} {1000*res["time"]:10.1f} {res["rss_mb"]:9.1f} {res["delta_rss_mb"]:10.1f}  {", ".join(res["heavy"])}')
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 3)
@@ -0,0 +1,412 @@
+""" benchmark suite: wall time, peak memory and evaluations of the models for a range of problem sizes
+
+run as: python benchmark_suite.py run [--bench PATTERN] [--quick] [--repeat N]
+        python benchmark_suite.py compare [BASE] [HEAD] [--factor 1.2]
+        python benchmark_suite.py list
+
+Each benchmark is a setup function registered with the benchmark decorator and the values of its
+parameters, as in asv. The setup returns a function running the benchmark once. Every combination of
+parameters is measured in a fresh interpreter: the best and median wall time over repeats after a
+warm-up call, the peak resident memory and the number of evaluations of the model's inner function
+in one call. A setup raising NotImplementedError skips that combination.
+
+The results are stored in .benchmarks/<machine>/<commit>.json (a '+dirty' suffix is added to the
+commit if the tree has changes). compare reports the ratio of each result between two stored commits
+and flags a regression if time or memory grows by more than factor or the evaluations grow. Without
+arguments it compares the latest results with those of the closest earlier commit.
+"""
+
+import argparse
+import fnmatch
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+STORE = os.path.join(ROOT, '.benchmarks')
+
+# name: (setup, params)
+BENCHMARKS = {}
+
+def benchmark(name, **params):
+    """ register a setup function, params are lists of values and every combination is run """
+
+    def register(setup):
+        BENCHMARKS[name] = (setup, params)
+        return setup
+
+    return register
+
+def _import(folder, module):
+    """ import a project module, which imports its siblings by name """
+
+    path = os.path.join(ROOT, folder)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+    return __import__(module)
+
+class Counter:
+    """ wrap the functions owner.name for each name to count the number of points they evaluate """
+
+    def __init__(self, owner, *names, size=None):
+
+        self.n = 0
+        size = (lambda args, kwargs, result: _size(result)) if size is None else size
+        for name in names:
+            setattr(owner, name, self._counted(getattr(owner, name), size))
+
+    def _counted(self, func, size):
+
+        def counted(*args, **kwargs):
+            result = func(*args, **kwargs)
+            self.n += size(args, kwargs, result)
+            return result
+
+        return counted
+
+def _size(x):
+    import numpy as np
+    return int(np.size(x))
+
+##################
+# benchmarks #
+##################
+
+SALON = dict(rho=0.90, iota=0.01, sigma_epsilon=0.10, R=(1+0.01)**(1/12), eta=0.5, w=1.0)
+
+def _household():
+    HSM = _import('inauguralproject', 'HouseholdSpecializationModel')
+    return HSM.HouseholdSpecializationModelClass, Counter(HSM.HouseholdSpecializationModelClass, 'calc_utility')
+
+@benchmark('household.solve_discrete', Nx=[25, 49, 97])
+def bench_solve_discrete(Nx):
+
+    model_class, counter = _household()
+
+    def run():
+        model = model_class()
+        model.par.Nx = Nx
+        model.solve_discrete()
+
+    return run, counter
+
+@benchmark('household.solve', solve_method=['numerical', 'analytic', 'hessian'])
+def bench_solve(solve_method):
+
+    model_class, counter = _household()
+
+    def run():
+        model = model_class()
+        model.par.solve_method = solve_method
+        model.solve()
+
+    return run, counter
+
+@benchmark('household.solve_wF_vec', num_wF=[5, 25, 100], discrete=[False, True])
+def bench_solve_wF_vec(num_wF, discrete):
+    import numpy as np
+
+    model_class, counter = _household()
+
+    def run():
+        model = model_class()
+        model.par.wF_vec = np.linspace(0.8, 1.2, num_wF)
+        model.solve_wF_vec(discrete=discrete)
+
+    return run, counter
+
+@benchmark('household.estimate', num_wF=[5, 25])
+def bench_estimate(num_wF):
+    import numpy as np
+
+    model_class, counter = _household()
+
+    def run():
+        model = model_class()
+        model.par.wF_vec = np.linspace(0.8, 1.2, num_wF)
+        model.estimate()
+
+    return run, counter
+
+@benchmark('stackelberg.get_optimal_quantities', num_points=[10, 100, 1000], method=['analytic', 'numerical', 'nelder-mead'])
+def bench_get_optimal_quantities(num_points, method):
+    import numpy as np
+
+    if method == 'nelder-mead' and num_points > 100:
+        raise NotImplementedError # one nested optimization per point
+
+    Stackelberg = _import('modelproject', 'Stackelberg')
+    counter = Counter(Stackelberg.StackelbergDuopoly, 'profit_f', 'profit_l')
+    c = np.linspace(1, 20, num_points)
+
+    def run():
+        Stackelberg.solve_equilibria(c, 20, 1, method=method)
+
+    return run, counter
+
+def _salon(module):
+    salon = _import('examproject', 'salon')
+    counter = Counter(salon, 'ex_post_values', size=lambda args, kwargs, result: _size(args[0])*_size(kwargs.get('delta', 0.0)))
+    return _import('examproject', module), counter
+
+@benchmark('salon.H', K=[1_000, 10_000, 100_000])
+def bench_H(K):
+
+    problem, counter = _salon('problem2_q2')
+
+    def run():
+        problem.H(K=K, **SALON)
+
+    return run, counter
+
+@benchmark('salon.H2', K=[1_000, 10_000, 100_000])
+def bench_H2(K):
+
+    problem, counter = _salon('problem2_q3')
+
+    def run():
+        problem.H2(K=K, **SALON)
+
+    return run, counter
+
+@benchmark('salon.H3', K=[1_000, 10_000])
+def bench_H3(K):
+
+    problem, counter = _salon('problem2_q4')
+
+    def run():
+        problem.H3(K=K, **SALON)
+
+    return run, counter
+
+@benchmark('multistart.algorithm', K=[50, 200, 1000])
+def bench_algorithm(K):
+
+    problem = _import('examproject', 'problem3_q1_q2')
+    counter = Counter(problem, 'griewank') # the objective passed to the local searches
+
+    def run():
+        problem.algorithm(K_underline=10, K=K, bounds=[-600, 600], tol=1e-8)
+
+    return run, counter
+
+#################
+# measuring #
+#################
+
+def _case_name(name, params):
+    return f'{name}({", ".join(f"{k}={v}" for k,v in params.items())})'
+
+def cases(pattern='*', quick=False):
+    """ (name, params) of every combination of parameters of the benchmarks matching pattern """
+
+    for name,(setup,params) in BENCHMARKS.items():
+        if not fnmatch.fnmatch(name, pattern): continue
+        values = [v[:1] for v in params.values()] if quick else params.values()
+        for combination in itertools.product(*values):
+            yield name, dict(zip(params, combination))
+
+def measure_case(name, params, repeat=5, budget=10.0):
+    """ run a benchmark in this process (called in a fresh interpreter by run) """
+
+    import resource
+
+    try:
+        run, counter = BENCHMARKS[name][0](**params)
+    except NotImplementedError:
+        return None
+    rss_setup = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # a. warm-up call, which also counts the evaluations
+    counter.n = 0
+    t0 = time.perf_counter()
+    run()
+    timings = [time.perf_counter()-t0]
+    evals = counter.n
+
+    # b. repeats within the time budget
+    while len(timings) < repeat+1 and sum(timings) < budget:
+        t0 = time.perf_counter()
+        run()
+        timings.append(time.perf_counter()-t0)
+
+    timings = sorted(timings[1:] if len(timings) > 1 else timings)
+
+    return dict(time=timings[0], time_median=timings[len(timings)//2], repeats=len(timings), evals=evals,
+                peak_rss_mb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024, # kB on linux
+                setup_rss_mb=rss_setup/1024)
+
+def _git(*args):
+    return subprocess.run(['git', *args], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+
+def commit_key():
+    """ current commit, with a '+dirty' suffix if the tree has changes outside the results """
+
+    dirty = any(not line[3:].startswith('.benchmarks') for line in _git('status', '--porcelain').splitlines())
+    return _git('rev-parse', '--short=12', 'HEAD') + ('+dirty' if dirty else '')
+
+def _machine_dir():
+    return os.path.join(STORE, platform.node() or 'local')
+
+def load(key):
+    with open(os.path.join(_machine_dir(), f'{key}.json')) as f:
+        return json.load(f)
+
+def run(pattern='*', quick=False, repeat=5, budget=10.0, do_print=True):
+    """ measure all cases in fresh interpreters and add the results to the store """
+
+    import numpy as np
+    import scipy
+
+    key = commit_key()
+    path = os.path.join(_machine_dir(), f'{key}.json')
+    os.makedirs(_machine_dir(), exist_ok=True)
+
+    # results of earlier runs on this commit are kept unless measured again
+    stored = load(key) if os.path.exists(path) else dict(results={})
+    stored.update(commit=key, commit_date=_git('show', '-s', '--format=%cI', 'HEAD'),
+                  env=dict(python=platform.python_version(), numpy=np.__version__, scipy=scipy.__version__,
+                           cpus=os.cpu_count(), machine=platform.machine()))
+
+    if do_print:
+        print(f'{key} on {platform.node()}')
+        print(f'{"benchmark":>70s} {"time [s]":>10s} {"median [s]":>11s} {"evals":>12s} {"peak rss [MB]":>14s}')
+
+    for name,params in cases(pattern, quick):
+
+        out = subprocess.run([sys.executable, __file__, '_case', name, json.dumps(params), str(repeat), str(budget)],
+                             cwd=ROOT, capture_output=True, text=True)
+        case = _case_name(name, params)
+        if out.returncode != 0:
+            if do_print: print(f'{case:>70s} failed: {out.stderr.strip().splitlines()[-1]}')
+            continue
+
+        res = json.loads(out.stdout.strip().splitlines()[-1])
+        if res is None:
+            if do_print: print(f'{case:>70s} skipped')
+            continue
+
+        stored['results'][case] = dict(name=name, params=params, **res)
+        stored['timestamp'] = time.time()
+        with open(path, 'w') as f: # after every case, so an interrupted run keeps its results
+            json.dump(stored, f, indent=1)
+
+        if do_print:
+            print(f'{case:>70s} {res["time"]:10.6f} {res["time_median"]:11.6f} {res["evals"]:12d} {res["peak_rss_mb"]:14.1f}')
+
+    return stored
+
+#################
+# comparing #
+#################
+
+def stored_keys():
+    """ stored commits of this machine, oldest results first """
+
+    if not os.path.isdir(_machine_dir()): return []
+    keys = [f[:-len('.json')] for f in os.listdir(_machine_dir()) if f.endswith('.json')]
+
+    return sorted(keys, key=lambda key: load(key).get('timestamp', 0))
+
+def default_pair():
+    """ the latest results and those of the closest earlier commit in the history """
+
+    keys = stored_keys()
+    if len(keys) < 2:
+        raise ValueError('need results for two commits, use run on both')
+
+    head = keys[-1]
+    history = _git('rev-list', '--abbrev-commit', '--abbrev=12', head.split('+')[0]).splitlines()
+    if not head.endswith('+dirty'): history = history[1:]
+    for sha in history:
+        if sha in keys:
+            return sha, head
+
+    raise ValueError(f'no stored results for a commit before {head}')
+
+def compare(base=None, head=None, factor=1.2, do_print=True):
+    """Compare the results of two commits
+
+    Returns
+    -------
+    list
+        One dict per case measured in both with the ratios head/base and whether it is a regression
+        ('+'), an improvement ('-') or neither ('')
+    """
+    if base is None or head is None:
+        base, head = default_pair() if base is None and head is None else (base, head or stored_keys()[-1])
+
+    results_base, results_head = load(base)['results'], load(head)['results']
+
+    rows = []
+    for case in results_head:
+        if case not in results_base: continue
+        a, b = results_base[case], results_head[case]
+
+        ratio = dict(time=b['time']/a['time'], peak_rss_mb=b['peak_rss_mb']/a['peak_rss_mb'],
+                     evals=b['evals']/a['evals'] if a['evals'] else (1.0 if b['evals'] == 0 else float('inf')))
+        if ratio['time'] > factor or ratio['peak_rss_mb'] > factor or ratio['evals'] > 1.0:
+            flag = '+'
+        elif ratio['time'] < 1/factor or ratio['peak_rss_mb'] < 1/factor or ratio['evals'] < 1.0:
+            flag = '-'
+        else:
+            flag = ''
+        rows.append(dict(case=case, base=a, head=b, ratio=ratio, flag=flag))
+
+    if do_print:
+        print(f'{base} -> {head} (+ regression, - improvement, factor {factor})')
+        print(f'  {"benchmark":>70s} {"time [s]":>21s} {"ratio":>6s} {"peak rss [MB]":>15s} {"ratio":>6s} {"evals":>21s}')
+        for row in rows:
+            a, b, r = row['base'], row['head'], row['ratio']
+            print(f'{row["flag"]:1s} {row["case"]:>70s} {a["time"]:10.6f} {b["time"]:10.6f} {r["time"]:6.2f}',
+                  f'{a["peak_rss_mb"]:7.1f} {b["peak_rss_mb"]:7.1f} {r["peak_rss_mb"]:6.2f} {a["evals"]:10d} {b["evals"]:10d}')
+
+    return rows
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    parser_run = commands.add_parser('run', help='measure the benchmarks on the current commit')
+    parser_run.add_argument('--bench', default='*', help='pattern of benchmark names, e.g. household.*')
+    parser_run.add_argument('--quick', action='store_true', help='only the first value of each parameter')
+    parser_run.add_argument('--repeat', type=int, default=5, help='number of timed calls after the warm-up')
+    parser_run.add_argument('--budget', type=float, default=10.0, help='seconds after which no more calls are timed')
+
+    parser_compare = commands.add_parser('compare', help='compare the results of two commits')
+    parser_compare.add_argument('base', nargs='?')
+    parser_compare.add_argument('head', nargs='?')
+    parser_compare.add_argument('--factor', type=float, default=1.2, help='ratio of time or memory counted as a change')
+
+    commands.add_parser('list', help='list the benchmarks and the stored commits')
+
+    parser_case = commands.add_parser('_case') # one case, run in a fresh interpreter
+    parser_case.add_argument('name')
+    parser_case.add_argument('params')
+    parser_case.add_argument('repeat', type=int)
+    parser_case.add_argument('budget', type=float)
+
+    args = parser.parse_args(argv)
+
+    if args.command == '_case':
+        print(json.dumps(measure_case(args.name, json.loads(args.params), args.repeat, args.budget)))
+    elif args.command == 'run':
+        run(args.bench, args.quick, args.repeat, args.budget)
+    elif args.command == 'compare':
+        rows = compare(args.base, args.head, args.factor)
+        return 1 if any(row['flag'] == '+' for row in rows) else 0
+    else:
+        for name,params in cases():
+            print(_case_name(name, params))
+        print('stored:', ', '.join(stored_keys()) or 'none')
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,64 +1,200 @@
-import pandas as pd
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from types import SimpleNamespace
+
 import numpy as np
-import matplotlib.pyplot as plt
-import ipywidgets as widgets
-#%pip install matplotlib-venn
-from matplotlib_venn import venn2
-from statsmodels.tsa.statespace.sarimax import SARIMAX
 
-filename = 'data/Bachelor-data.xlsx' # open the file (read)
-df = pd.read_excel(filename)
-df.rename(columns={'Unnamed: 0':'year'}, inplace = True) # rename the unnamed year column to year (clean)
+# pandas, matplotlib and ipywidgets are imported where they are used
 
+filename = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'Bachelor-data.xlsx')
 
-# this code is used for skipping quarters in the plots to avoid to many entries on the x-axis
-l =[]
-for j, i in enumerate(df.year.values):
+def _sha256(path):
+    """ hash of the file content """
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(2**20), b''):
+            h.update(block)
+    return h.hexdigest()
 
-    if j%4==0 :
-        pass
-    else:
-        i = '' 
-    l.append(i)
-l = np.array(l)    
+def _write_cache(dataframe, cache_dir, meta):
+    """ store each column as a .npy file and the column names in meta.json """
+    os.makedirs(cache_dir, exist_ok=True)
+    meta['columns'] = list(dataframe.columns)
+    for i, column in enumerate(dataframe.columns):
+        values = dataframe[column].to_numpy()
+        if values.dtype == object or not np.issubdtype(values.dtype, np.number):
+            values = values.astype(str) # fixed width unicode, so no pickling is needed
+        np.save(os.path.join(cache_dir, f'{i}.npy'), values)
+    with open(os.path.join(cache_dir, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+
+def load_data(filename=filename, cache_dir=None):
+    """Load the workbook through a columnar cache
+
+    The first time the workbook is read with pandas and converted to one .npy file per column
+    in cache_dir (default data/.cache next to the workbook). The cache is used as long as the
+    workbook has the same mtime and size, or else the same sha256 hash, and the columns are
+    memory mapped when loaded.
+
+    Returns a new dataframe with the year column named year.
+    """
+    import pandas as pd
+
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(filename), '.cache', os.path.splitext(os.path.basename(filename))[0])
+    meta_file = os.path.join(cache_dir, 'meta.json')
+
+    stat = os.stat(filename)
+    meta = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+
+    cached = None
+    if os.path.exists(meta_file):
+        with open(meta_file) as f:
+            cached = json.load(f)
+
+    # a. check the cache, only hashing the file if it has been touched
+    valid = cached is not None and cached['mtime_ns'] == meta['mtime_ns'] and cached['size'] == meta['size']
+    if cached is not None and not valid:
+        meta['sha256'] = _sha256(filename)
+        valid = cached.get('sha256') == meta['sha256']
+        if valid: # same content, remember the new mtime
+            cached.update(meta)
+            with open(meta_file, 'w') as f:
+                json.dump(cached, f)
+
+    # b. load from cache
+    if valid:
+        return pd.DataFrame({column: np.load(os.path.join(cache_dir, f'{i}.npy'), mmap_mode='r')
+                             for i, column in enumerate(cached['columns'])})
+
+    # c. read the workbook and build the cache
+    dataframe = pd.read_excel(filename)
+    dataframe.rename(columns={'Unnamed: 0':'year'}, inplace = True) # rename the unnamed year column to year (clean)
+
+    meta.setdefault('sha256', _sha256(filename))
+    _write_cache(dataframe, cache_dir, meta)
+
+    return dataframe
+
+_df = None
 
+def __getattr__(name):
+    """ the dataframe df is loaded on first access """
+    global _df
+    if name == 'df':
+        if _df is None:
+            _df = load_data()
+        return _df
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# ticks at every 4th quarter (or a multiple of 4 for long series) to avoid to many entries on the x-axis
+def _quarter_ticks(dataframe, max_ticks=40):
+    """ positions and labels of the x ticks """
+    years = dataframe['year'].values if 'year' in dataframe else dataframe.index.values
+    step = 4*max(1, int(np.ceil(len(years)/4/max_ticks)))
+    positions = np.arange(0, len(years), step)
+    return positions, np.asarray(years)[positions].astype(str)
+
+def _lttb(x, y, n_out):
+    """Largest-Triangle-Three-Buckets downsampling of (x, y) to n_out points
+
+    The first and last points are kept and from each of the n_out-2 buckets in between the point
+    forming the largest triangle with the previously chosen point and the average of the next bucket.
+    """
+    n = len(x)
+    if n <= n_out or n_out < 3:
+        return x, y
+
+    edges = np.linspace(1, n-1, n_out-1).astype(int)
+    chosen = np.empty(n_out, dtype=int)
+    chosen[0], chosen[-1] = 0, n-1
+
+    a = 0
+    for i in range(n_out-2):
+        lo, hi = edges[i], edges[i+1]
+        next_lo, next_hi = (edges[i+1], edges[i+2]) if i+2 < len(edges) else (n-1, n)
+        avg_x, avg_y = x[next_lo:next_hi].mean(), y[next_lo:next_hi].mean()
+
+        area = np.abs((x[a]-avg_x)*(y[lo:hi]-y[a]) - (x[a]-x[lo:hi])*(avg_y-y[a]))
+        a = lo + np.argmax(area)
+        chosen[i+1] = a
+
+    return x[chosen], y[chosen]
+
+def _timeseries_state(dataframe, ax, max_points=1000):
+    """ what is computed once per dataframe and axes: the ticks and the lines drawn so far """
+    return SimpleNamespace(ax=ax, ticks=_quarter_ticks(dataframe), lines={}, max_points=max_points)
 
 # function that takes a dataframe and creates a plot
-def _plot_timeseries(dataframe, variable):
+# if state is given the plot is drawn in state.ax, reusing the ticks and lines stored in state
+def _plot_timeseries(dataframe, variable, state=None):
+    import matplotlib.pyplot as plt
     
-    fig = plt.figure(dpi=100)
-    ax = fig.add_subplot(1,1,1)
+    show = state is None
+    if show:
+        fig = plt.figure(dpi=100)
+        state = _timeseries_state(dataframe, fig.add_subplot(1,1,1))
+    ax = state.ax
     variable = list(variable)
-    
-    x = dataframe.year.values
-    y = dataframe[variable].values
-    
 
-    ax.plot(x,y, label = variable)
+    # only show the selected variables, creating (downsampled) lines the first time a variable is selected
+    for line in state.lines.values():
+        line.set_visible(False)
+    for v in variable:
+        if v not in state.lines:
+            y = np.asarray(dataframe[v], dtype=float)
+            x = np.arange(len(y))
+            I = np.isfinite(y)
+            state.lines[v], = ax.plot(*_lttb(x[I], y[I], state.max_points), label = v)
+        state.lines[v].set_visible(True)
+    ax.relim(visible_only=True)
+    ax.autoscale_view()
+
     if len(variable) != 1:
 
         title = ' and '.join(variable)
     else:
         title = variable[0]
     ax.set_title(title)
-    ax.set_xticklabels(l,rotation= 90)
-    ax.legend(loc='upper right')
-    plt.show()  
+    ax.set_xticks(state.ticks[0], state.ticks[1], rotation= 90)
+    ax.legend(handles=[state.lines[v] for v in variable], loc='upper right')
+    if show:
+        plt.show()  
 
-# plots the plots interactivly     
-def plot_timeseries(dataframe):
-    """plot the time series with interactions"""
-    
-    widgets.interact(_plot_timeseries, 
-    dataframe = widgets.fixed(dataframe),
+# plots the plots interactivly, redrawing the same figure
+def plot_timeseries(dataframe, max_points=1000):
+    """plot the time series with interactions, series longer than max_points are downsampled"""
+    import matplotlib.pyplot as plt
+    import ipywidgets as widgets
+    from IPython.display import display, clear_output
+
+    options = [column for column in dataframe.columns if column != 'year' and np.issubdtype(dataframe[column].dtype, np.number)]
     variable = widgets.SelectMultiple(
         description='variable', 
-        options=['Unemployment rate','Total employment, growth','Central bank key interest rate','CPI','Private consumption, growth','Private final consumption, volume', 'Government consumption, growth', 'Government consumption, volume', 'GDP, growth','GDP, volume, market prices','taxes', 'CPI, growth'], 
-        value=['CPI']),
-    ); 
+        options=options, 
+        value=['CPI'] if 'CPI' in options else options[:1])
+
+    with plt.ioff():
+        fig = plt.figure(dpi=100)
+    state = _timeseries_state(dataframe, fig.add_subplot(1,1,1), max_points)
+    out = widgets.Output()
+
+    def update(variable):
+        _plot_timeseries(dataframe, variable, state=state)
+        with out:
+            clear_output(wait=True)
+            display(fig)
+
+    widgets.interactive_output(update, {'variable': variable})
+    display(widgets.VBox([variable, out]))
 
 def phillips_curve(a = 2, slope= -2):
     """Plots the phillips curve"""
+    import matplotlib.pyplot as plt
+
     # Define the Phillips curve parameters
     a = a
     slope = slope
@@ -81,16 +217,125 @@ def phillips_curve(a = 2, slope= -2):
     plt.show()
 
 
+# Fitting the Phillips curve inflation = a + slope*log(unemployment)
+def _phillips_data(dataframe):
+    """ log unemployment and inflation for the quarters where both exist """
+    y = dataframe['CPI, growth'] if 'CPI, growth' in dataframe else dataframe['CPI'].diff() * 100
+    x = np.log(np.asarray(dataframe['Unemployment rate'], dtype=float))
+    y = np.asarray(y, dtype=float)
+    I = np.isfinite(x) & np.isfinite(y)
+    return x, y, I
+
+def _ols(n, Sx, Sy, Sxx, Sxy):
+    """ intercept and slope from the sums of 1, x, y, x^2 and xy, for arrays of sums """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = (n*Sxy - Sx*Sy) / (n*Sxx - Sx**2)
+        a = (Sy - slope*Sx) / n
+    return a, slope
+
+def fit_phillips_curve(dataframe=None, weights=None):
+    """Least squares estimate of (a, slope)
+
+    weights can have shape (B, n) with one row of weights (e.g. bootstrap counts) per fit,
+    so B fits are computed in one call.
+    """
+    if dataframe is None:
+        dataframe = load_data()
+    x, y, I = _phillips_data(dataframe)
+    x, y = x[I], y[I]
+
+    w = np.ones(x.size) if weights is None else np.asarray(weights, dtype=float)
+    return _ols(w.sum(axis=-1), w@x, w@y, w@(x*x), w@(x*y))
+
+def rolling_phillips_curve(dataframe=None, window=None):
+    """Estimates of (a, slope) in a rolling window of window quarters, or an expanding window if window is None
+
+    The sums in all windows are computed from prefix sums, so all quarters take O(n) in total.
+    The data are centered first to limit the cancellation in differences of prefix sums.
+    Returns a dataframe with year, a and slope for the window ending in each quarter (NaN with fewer than 2 observations).
+    """
+    import pandas as pd
+
+    if dataframe is None:
+        dataframe = load_data()
+    x, y, I = _phillips_data(dataframe)
+
+    x_mean, y_mean = x[I].mean(), y[I].mean()
+    xc = np.where(I, x - x_mean, 0.0)
+    yc = np.where(I, y - y_mean, 0.0)
+
+    # prefix sums with a leading zero, so the window (i-window, i] is S[i+1]-S[i+1-window]
+    S = np.zeros((5, x.size+1))
+    np.cumsum(np.stack([I, xc, yc, xc*xc, xc*yc]), axis=1, out=S[:,1:])
+
+    end = np.arange(1, x.size+1)
+    start = np.zeros(x.size, dtype=int) if window is None else np.maximum(end-window, 0)
+    n, Sx, Sy, Sxx, Sxy = S[:,end] - S[:,start]
+
+    a_c, slope = _ols(n, Sx, Sy, Sxx, Sxy)
+    a = a_c + y_mean - slope*x_mean # undo the centering
+    a[n < 2], slope[n < 2] = np.nan, np.nan
+
+    return pd.DataFrame({'year': dataframe['year'].values, 'a': a, 'slope': slope})
+
+def _bootstrap_chunk(x, y, B, seed, i):
+    """ B bootstrap estimates with the i'th generator spawned from seed """
+    rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(i,)))
+    counts = rng.multinomial(x.size, np.full(x.size, 1/x.size), size=B).astype(float)
+    return _ols(counts.sum(axis=1), counts@x, counts@y, counts@(x*x), counts@(x*y))
+
+def bootstrap_phillips_curve(dataframe=None, B=2000, level=0.95, u=None, seed=1986, chunk_size=500, workers=None):
+    """Bootstrap confidence bands for the fitted Phillips curve
+
+    The quarters are resampled with replacement in chunks of chunk_size draws, each chunk with its own
+    generator spawned from seed, so the result is the same with or without a process pool (workers).
+    Returns a namespace with the estimates a and slope, the bootstrap draws, the unemployment rates u and
+    the fitted curve with its lower and upper band.
+    """
+    if dataframe is None:
+        dataframe = load_data()
+    x, y, I = _phillips_data(dataframe)
+    x, y = x[I], y[I]
+
+    sizes = [min(chunk_size, B-start) for start in range(0, B, chunk_size)]
+    if workers is None:
+        chunks = [_bootstrap_chunk(x, y, size, seed, i) for i, size in enumerate(sizes)]
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            chunks = list(pool.map(_bootstrap_chunk, repeat(x), repeat(y), sizes, repeat(seed), range(len(sizes))))
+
+    res = SimpleNamespace()
+    res.a, res.slope = fit_phillips_curve(dataframe)
+    res.draws = np.column_stack([np.concatenate([c[0] for c in chunks]), np.concatenate([c[1] for c in chunks])])
+
+    res.u = np.linspace(np.exp(x.min()), np.exp(x.max()), 100) if u is None else np.asarray(u, dtype=float)
+    curves = res.draws[:,:1] + res.draws[:,1:]*np.log(res.u)
+    res.curve = res.a + res.slope*np.log(res.u)
+    res.lower, res.upper = np.quantile(curves, [(1-level)/2, (1+level)/2], axis=0)
+
+    return res
+
+
 # Function to combine Phillips curve and scatter plot
-def graph_combine(dataframe = df):
-    """Plots the Phillips curve and scatter plot"""
+def graph_combine(dataframe = None, fit = False):
+    """Plots the Phillips curve and scatter plot, with fit=True the fitted curve and its 95% bootstrap band"""
+    import matplotlib.pyplot as plt
+
+    if dataframe is None:
+        dataframe = load_data()
+        dataframe['CPI, growth'] = dataframe['CPI'].diff() * 100
     fig, ax = plt.subplots()
     
     # Plot the scatter plot
     dataframe.plot.scatter(x='Unemployment rate', y='CPI, growth', ax=ax, title='Swedish Phillips-curve 1990Q1-2020Q1', label = 'actual data')
     
     # Plot the Phillips curve
-    phillips_curve()    
+    if fit:
+        res = bootstrap_phillips_curve(dataframe)
+        ax.plot(res.u, res.curve, color='red', label=f'Fitted Phillips curve: {res.a:.2f} + {res.slope:.2f} log(u)')
+        ax.fill_between(res.u, res.lower, res.upper, color='red', alpha=0.2, label='95% bootstrap band')
+    else:
+        phillips_curve()    
     # Set labels and legend
     ax.set_xlabel('Unemployment Rate')
     ax.set_ylabel('Inflation Rate')
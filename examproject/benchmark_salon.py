@@ -0,0 +1,66 @@
+""" benchmark of the salon simulation: python loop vs numpy vs numba
+
+run as: python benchmark_salon.py [K ...]
+"""
+
+import sys
+import time
+
+import numpy as np
+
+import salon
+
+def _ex_post_values_loop(shock_series, rho, iota, R, eta, w, delta=0.0):
+    """ the original implementation, looping in python over series and periods """
+
+    ex_post_values = []
+    for shocks in shock_series:
+        ex_post_value = 0
+        ell_previous = 0
+        kappa_previous = 1
+
+        for t in range(len(shocks)):
+            kappa_t = np.exp(rho * np.log(kappa_previous) + shocks[t])
+
+            ell_star = ((1 - eta) * kappa_t / w)**(1 / eta)
+            ell_t = ell_star if abs(ell_previous - ell_star) > delta else ell_previous
+
+            adjustment_cost = iota if ell_t != ell_previous else 0
+            profit = kappa_t*ell_t**(1-eta) - w * ell_t - adjustment_cost
+            ex_post_value += R ** (-t) * profit
+
+            ell_previous = ell_t
+
+        ex_post_values.append(ex_post_value)
+
+    return np.array(ex_post_values)
+
+def run(K_values=(10**3,10**4,10**5), rho=0.90, iota=0.01, sigma_epsilon=0.10, R=(1+0.01)**(1/12), eta=0.5, w=1.0):
+
+    # compile once before timing
+    salon.ex_post_values(salon.draw_shocks(sigma_epsilon,2), rho, iota, R, eta, w, backend='numba')
+
+    print(f'numba available: {salon._compiled_kernel() is not None}')
+    print(f'{"K":>8s} {"loop [s]":>10s} {"numpy [s]":>10s} {"numba [s]":>10s} {"speedup numpy":>14s} {"speedup numba":>14s}')
+    for K in K_values:
+
+        shock_series = salon.draw_shocks(sigma_epsilon, K)
+
+        timings = {}
+        values = {}
+        for name,func in [('loop',lambda: _ex_post_values_loop(shock_series, rho, iota, R, eta, w)),
+                          ('numpy',lambda: salon.ex_post_values(shock_series, rho, iota, R, eta, w, backend='numpy')),
+                          ('numba',lambda: salon.ex_post_values(shock_series, rho, iota, R, eta, w, backend='numba'))]:
+            t0 = time.perf_counter()
+            values[name] = func()
+            timings[name] = time.perf_counter()-t0
+
+        assert np.allclose(values['loop'],values['numpy'],rtol=0,atol=1e-10)
+        assert np.allclose(values['loop'],values['numba'],rtol=0,atol=1e-10)
+
+        print(f'{K:8d} {timings["loop"]:10.3f} {timings["numpy"]:10.3f} {timings["numba"]:10.3f}',
+              f'{timings["loop"]/timings["numpy"]:14.1f} {timings["loop"]/timings["numba"]:14.1f}')
+
+if __name__ == '__main__':
+    K_values = [int(float(K)) for K in sys.argv[1:]] or (10**3,10**4,10**5)
+    run(K_values)
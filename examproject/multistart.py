@@ -0,0 +1,295 @@
+# import packages
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from types import SimpleNamespace
+
+import numpy as np
+from scipy import optimize
+
+######################
+# test objectives #
+######################
+
+def griewank(x):
+    """ n-dimensional Griewank function of the last axis of x, so a batch of m points has shape (m,n) """
+    x = np.asarray(x)
+    i = np.arange(1, x.shape[-1]+1)
+    A = np.sum(x**2, axis=-1)/4000
+    B = np.prod(np.cos(x/np.sqrt(i)), axis=-1)
+    return A-B+1
+
+def griewank_grad(x):
+    """ gradient of griewank, with the same shape as x """
+    x = np.asarray(x)
+    i = np.arange(1, x.shape[-1]+1)
+    c = np.cos(x/np.sqrt(i))
+    s = np.sin(x/np.sqrt(i))
+
+    # product of the other cosines from cumulative products to the left and right,
+    # which avoids dividing by cosines that may be zero
+    ones = np.ones_like(c[...,:1])
+    left = np.cumprod(np.concatenate([ones, c[...,:-1]], axis=-1), axis=-1)
+    right = np.cumprod(np.concatenate([ones, c[...,:0:-1]], axis=-1), axis=-1)[...,::-1]
+
+    return x/2000 + s/np.sqrt(i)*left*right
+
+def rastrigin(x):
+    """ n-dimensional Rastrigin function of the last axis of x """
+    x = np.asarray(x)
+    return 10*x.shape[-1] + np.sum(x**2 - 10*np.cos(2*np.pi*x), axis=-1)
+
+def rastrigin_grad(x):
+    """ gradient of rastrigin """
+    x = np.asarray(x)
+    return 2*x + 20*np.pi*np.sin(2*np.pi*x)
+
+# name: (objective, gradient, bounds for each dimension, global minimum)
+OBJECTIVES = {
+    'griewank': (griewank, griewank_grad, (-600, 600), 0.0),
+    'rastrigin': (rastrigin, rastrigin_grad, (-5.12, 5.12), 0.0),
+    'rosenbrock': (optimize.rosen, optimize.rosen_der, (-5, 10), 0.0),
+}
+
+def register_objective(name, func, grad=None, bounds=(-1, 1), f_min=0.0):
+    """ add an objective to the benchmark suite """
+    OBJECTIVES[name] = (func, grad, bounds, f_min)
+
+###################
+# initial draws #
+###################
+
+def draw_initial(bounds, K, sampler='random', seed=1986):
+    """Draw K initial guesses within bounds
+
+    Parameters
+    ----------
+    bounds : array
+        Lower and upper bound for each dimension, shape (n,2)
+        K : int
+        Number of draws
+        sampler : str
+        'random' (uniform draws), 'sobol' or 'halton'
+        seed : int
+        Seed
+
+    Returns
+    -------
+    ndarray
+        Draws with shape (K,n)
+    """
+    bounds = np.asarray(bounds, dtype=float)
+    n = bounds.shape[0]
+
+    if sampler == 'random':
+        # same numbers as np.random.seed(seed) followed by K draws of size n
+        return np.random.RandomState(seed).uniform(bounds[:,0], bounds[:,1], (K,n))
+    elif sampler == 'sobol':
+        from scipy.stats import qmc # slow to import, so only for quasi-random draws
+        u = qmc.Sobol(d=n, seed=seed).random_base2(int(np.ceil(np.log2(max(K,1)))))[:K]
+    elif sampler == 'halton':
+        from scipy.stats import qmc
+        u = qmc.Halton(d=n, seed=seed).random(K)
+    else:
+        raise ValueError(f'unknown sampler {sampler}')
+
+    return qmc.scale(u, bounds[:,0], bounds[:,1])
+
+def screen_starts(func, bounds, m, n_best=100, n=None, sampler='random', seed=1986, chunk_size=100_000):
+    """Evaluate m candidate starting points and keep the n_best with the lowest values
+
+    The candidates are drawn and evaluated in chunks, so func must accept a batch of shape
+    (chunk_size,n) and m can be in the millions with memory bounded by chunk_size.
+
+    Returns
+    -------
+    x : ndarray
+        Best candidates with shape (n_best,n) sorted by value
+        f : ndarray
+        Their values
+    """
+    bounds = np.asarray(bounds, dtype=float)
+    if bounds.ndim == 1:
+        bounds = np.tile(bounds, (n if n is not None else 1, 1))
+
+    # the candidates are the first m draws of the sampler, drawn chunk by chunk
+    if sampler == 'random':
+        rng = np.random.RandomState(seed)
+        draw = lambda size: rng.uniform(bounds[:,0], bounds[:,1], (size,bounds.shape[0]))
+    else:
+        from scipy.stats import qmc
+        engine = {'sobol':qmc.Sobol,'halton':qmc.Halton}[sampler](d=bounds.shape[0], seed=seed)
+        draw = lambda size: qmc.scale(engine.random(size), bounds[:,0], bounds[:,1])
+
+    x_best = np.empty((0,bounds.shape[0]))
+    f_best = np.empty(0)
+    for start in range(0, m, chunk_size):
+        x = np.concatenate([x_best, draw(min(chunk_size, m-start))])
+        f = np.concatenate([f_best, func(x[len(x_best):])])
+        I = np.argpartition(f, n_best)[:n_best] if len(f) > n_best else np.arange(len(f))
+        x_best, f_best = x[I], f[I]
+
+    I = np.argsort(f_best)
+
+    return x_best[I], f_best[I]
+
+##################
+# multi-start #
+##################
+
+def _local_search(func, grad, x_k0, method, tol):
+    """ Step 3.E: run the local optimizer from x_k0 and record its cost """
+
+    t0 = time.perf_counter()
+    res = optimize.minimize(func, x_k0, jac=grad, method=method, tol=tol)
+    cost = SimpleNamespace(nfev=res.nfev, njev=getattr(res, 'njev', 0), nit=getattr(res, 'nit', 0),
+                           time=time.perf_counter()-t0, fun=res.fun, success=res.success)
+
+    return res.x, res.fun, cost
+
+def multistart(func, bounds, grad=None, n=None, tol=1e-8, K_underline=10, K=1000, method='BFGS',
+               sampler='random', f_target=0.0, seed=1986, workers=None, batch_size=None, record_trace=False):
+    """Global optimizer with refined multi-start strategy
+
+    The local searches are run in batches of batch_size iterations (default 1, or workers with a
+    process pool). All starting points in a batch are refined with the x_star known when the batch
+    is dispatched, using the chi_k of their own iteration k. With batch size 1 this is the sequential
+    algorithm. The algorithm stops when f_star < f_target + tol.
+
+    Parameters
+    ----------
+    func : callable
+        Objective taking an array of shape (n,)
+        bounds : array
+        Lower and upper bound, either a pair used for all dimensions or shape (n,2)
+        grad : callable
+        Gradient of func, None for finite differences
+        n : int
+        Number of dimensions, needed if bounds is a pair
+        tol : float
+        Tolerance level
+        K_underline : int
+        Number of iterations before the refined multi-start strategy is applied
+        K : int
+        Maximum number of iterations
+        method : str
+        Local method passed to scipy.optimize.minimize
+        sampler : str
+        Initial draws, see draw_initial
+        f_target : float
+        Known minimum value
+        seed : int
+        Seed
+        workers : int
+        Number of processes, func and grad must then be importable (defined in a module), as the
+        processes are spawned to be safe after salon's numba backend
+        batch_size : int
+        Number of iterations dispatched at a time
+        record_trace : bool
+        Record the effective initial guesses in a preallocated array
+
+    Returns
+    -------
+    SimpleNamespace
+        x_star and f_star, the iteration k where the algorithm stopped, the effective initial
+        guesses x_k0_all (None unless record_trace), total nfev and njev, the cost of each
+        local search in searches and the wall time
+    """
+    t0 = time.perf_counter()
+
+    bounds = np.asarray(bounds, dtype=float)
+    if bounds.ndim == 1:
+        bounds = np.tile(bounds, (n if n is not None else 1, 1))
+
+    # Step 3.A for all k
+    x_k_all = draw_initial(bounds, K, sampler=sampler, seed=seed)
+
+    if batch_size is None:
+        batch_size = 1 if workers is None else workers
+    pool = None if workers is None else ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'))
+
+    x_star = None
+    f_star = np.inf
+    x_k0_all = np.empty((K, bounds.shape[0])) if record_trace else None
+    searches = []
+
+    for k_batch in range(0, K, batch_size):
+
+        # Step 3.C and 3.D for the batch with the current x_star
+        ks = range(k_batch, min(k_batch+batch_size, K))
+        x_k0_batch = []
+        for k in ks:
+            if k >= K_underline:
+                chi_k = 0.50 * (2 / (1 + np.exp((k - K_underline) / 100))) # step 3.C
+                x_k0_batch.append(chi_k * x_k_all[k] + (1 - chi_k) * x_star) # step 3.D
+            else:
+                x_k0_batch.append(x_k_all[k])
+
+        # Step 3.E: Run the optimizer
+        if pool is None:
+            results = (_local_search(func, grad, x_k0, method, tol) for x_k0 in x_k0_batch)
+        else:
+            futures = [pool.submit(_local_search, func, grad, x_k0, method, tol) for x_k0 in x_k0_batch]
+            results = (future.result() for future in futures)
+
+        done = False
+        for k,x_k0,(x,f,cost) in zip(ks,x_k0_batch,results):
+
+            if record_trace: x_k0_all[k] = x_k0
+            cost.k = k
+            searches.append(cost)
+
+            # Step 3.F: Update x_star
+            if f < f_star:
+                x_star,f_star = x,f
+
+            # Step 3.G: Check if we've reached the specified tolerance
+            if f_star < f_target + tol:
+                done = True
+                break
+
+        if done: break
+
+    if pool is not None:
+        pool.shutdown(cancel_futures=True)
+
+    return SimpleNamespace(x_star=x_star, f_star=f_star, k=k, x_k0_all=x_k0_all[:k+1] if record_trace else None,
+                           nfev=sum(cost.nfev for cost in searches), njev=sum(cost.njev for cost in searches),
+                           searches=searches, converged=done, time=time.perf_counter()-t0)
+
+################
+# benchmark #
+################
+
+def benchmark(names=None, dims=(2,5,10,20,50), samplers=('random','sobol'), method='BFGS', tol=1e-8,
+              K_underline=10, K=200, use_grad=True, do_print=True):
+    """Run the multi-start on the registered objectives
+
+    Returns
+    -------
+    list
+        One dict per (objective, dimension, sampler) with the evaluations to tolerance
+        (or to K iterations if not converged) and the wall time
+    """
+    names = list(OBJECTIVES) if names is None else names
+    records = []
+
+    if do_print:
+        print(f'{"objective":>12s} {"n":>4s} {"sampler":>8s} {"converged":>10s} {"k":>6s} {"nfev":>8s} {"njev":>8s} {"f_star":>10s} {"time [s]":>9s}')
+
+    for name in names:
+        func,grad,bounds,f_min = OBJECTIVES[name]
+        for n in dims:
+            for sampler in samplers:
+                res = multistart(func, bounds, grad=grad if use_grad else None, n=n, tol=tol, K_underline=K_underline,
+                                 K=K, method=method, sampler=sampler, f_target=f_min)
+                record = dict(objective=name, n=n, sampler=sampler, converged=res.converged, k=res.k,
+                              nfev=res.nfev, njev=res.njev, f_star=res.f_star, time=res.time)
+                records.append(record)
+                if do_print:
+                    print(f'{name:>12s} {n:4d} {sampler:>8s} {str(res.converged):>10s} {res.k:6d} {res.nfev:8d} {res.njev:8d} {res.f_star:10.2e} {res.time:9.3f}')
+
+    return records
+
+if __name__ == '__main__':
+    benchmark()
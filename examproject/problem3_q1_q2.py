@@ -1,19 +1,10 @@
 # import packages
 import numpy as np
-import scipy as sp
-import matplotlib.pyplot as plt
-import sympy as sm
-from scipy import optimize
-from scipy.optimize import minimize
 
-def griewank(x):
-    return griewank_(x[0],x[1])
+from multistart import multistart, griewank, griewank_grad # n-dimensional, also for batches of shape (m,n)
     
 def griewank_(x1,x2):
-    A = x1**2/4000 + x2**2/4000
-    B = np.cos(x1/np.sqrt(1))*np.cos(x2/np.sqrt(2))
-    return A-B+1
-
+    return griewank(np.stack([x1,x2],axis=-1))
 
 # Define parameters
 bounds = [-600, 600]
@@ -22,9 +13,13 @@ K_underline = 10
 K = 1000
 
 
-def algorithm(K_underline, K, bounds, tol, figure_number='X'):
+def algorithm(K_underline, K, bounds, tol, workers=None, batch_size=None, record_trace=False):
     """Implementation of global optimizer with refined multi-start strategy
 
+    The Griewank case of multistart.multistart. With workers the local searches are run in a
+    process pool in batches of batch_size (default workers) iterations. Without workers the batch
+    size is 1, which is the sequential algorithm.
+
     Parameters
     ----------
     K_underline : int
@@ -35,53 +30,39 @@ def algorithm(K_underline, K, bounds, tol, figure_number='X'):
         Bounds for the uniform distribution
         tol : float
         Tolerance level
-        figure_number : int
-        Figure number for the plot
-    """
-    # set seed
-    np.random.seed(1986)
+        workers : int
+        Number of processes
+        batch_size : int
+        Number of iterations dispatched at a time
+        record_trace : bool
+        Record the effective initial guesses, needed for plot_algorithm
 
-    # Initialize x_star and empty list for storing x_k0
-    x_star = None
-    x_k0_all = [] 
+    Returns
+    -------
+    SimpleNamespace
+        x_star and f_star, the iteration k where the algorithm stopped, the effective
+        initial guesses x_k0_all, the number of evaluations and the cost of each local search
+    """
+    return multistart(griewank, bounds, grad=griewank_grad, n=2, tol=tol, K_underline=K_underline, K=K,
+                      method='BFGS', seed=1986, workers=workers, batch_size=batch_size, record_trace=record_trace)
 
-    # Algorithm
-    for k in range(K):
-        # Step 3.A: Draw a random initial guess x_k
-        x_k = np.random.uniform(bounds[0], bounds[1], 2)
-        
-        # Step 3.C and 3.D
-        if k >= K_underline:
-            chi_k = 0.50 * (2 / (1 + np.exp((k - K_underline) / 100))) # step 3.C
-            x_k0 = chi_k * x_k + (1 - chi_k) * x_star # step 3.D
-        else:
-            x_k0 = x_k 
+def plot_algorithm(res, figure_number='X'):
+    """Plot how the effective initial guesses vary with the iteration counter
 
-        x_k0_all.append(x_k0) # store results in list
-        
-        # Step 3.E: Run the optimizer
-        res = minimize(griewank, x_k0, method='BFGS', tol=tol)
-        
-        # Step 3.F: Update x_star if this is the first iteration or if the new result is better than the best so far
-        if x_star is None or griewank(res.x) < griewank(x_star):
-            x_star = res.x
-            
-        # Step 3.G: Check if we've reached the specified tolerance
-        if griewank(x_star) < tol:
-            break
+    Parameters
+    ----------
+    res : SimpleNamespace
+        Result of algorithm with record_trace=True
+        figure_number : int
+        Figure number for the plot
+    """
+    import matplotlib.pyplot as plt
 
-    # Plot how the effective initial guesses vary with the iteration counter
-    x_k0_all = np.array(x_k0_all)
     plt.figure(figsize=(10, 5))
-    plt.plot(x_k0_all[:, 0], label='x1')
-    plt.plot(x_k0_all[:, 1], label='x2')
+    plt.plot(res.x_k0_all[:, 0], label='x1')
+    plt.plot(res.x_k0_all[:, 1], label='x2')
     plt.xlabel('Iteration')
     plt.ylabel('Initial guess')
-    plt.title(f'Figure: {figure_number} Guesses by Iteration. Converged by {k} Iterations')
+    plt.title(f'Figure: {figure_number} Guesses by Iteration. Converged by {res.k} Iterations')
     plt.legend()
     plt.show()
-
-    print(f"The optimal x is {x_star}")
-
-    # test results are close to zero
-    assert np.allclose(x_star, np.zeros(2), atol=1e-4)
\ No newline at end of file
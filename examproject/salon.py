@@ -0,0 +1,497 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from types import SimpleNamespace
+
+import numpy as np
+from scipy import optimize
+
+# numba is imported the first time backend='numba' is used, see _compiled_kernel
+prange = range
+_kernel = None
+
+def draw_shocks(sigma_epsilon, K, T=120, seed=1986):
+    """
+    Function to draw the demand shocks used in the simulations
+
+    Args:
+    -----
+        sigma_epsilon (float): Standard deviation of demand shock
+        K (int): Number of shock series
+        T (int): Number of periods
+        seed (int): Seed of the random number generator
+
+    Returns:
+    --------
+        ndarray: Shocks with shape (K-1, T)
+
+    """
+    # same numbers as np.random.seed(seed) followed by np.random.normal, without touching the global state
+    rng = np.random.RandomState(seed)
+
+    return rng.normal(loc=-0.5 * sigma_epsilon**2, scale=sigma_epsilon, size=(K-1, T))
+
+def draw_shock_chunk(sigma_epsilon, i, chunk_size, T=120, seed=1986):
+    """
+    Function to draw chunk number i of a stream of shock series
+
+    Each chunk has its own generator seeded by SeedSequence(seed, spawn_key=(i,)), which is
+    the i'th child of SeedSequence(seed).spawn, so a chunk is the same whichever process draws it.
+
+    Returns:
+    --------
+        ndarray: Shocks with shape (chunk_size, T)
+
+    """
+    rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(i,)))
+
+    return rng.normal(loc=-0.5 * sigma_epsilon**2, scale=sigma_epsilon, size=(chunk_size, T))
+
+def stream_shocks(sigma_epsilon, K, T=120, seed=1986, chunk_size=100_000):
+    """ generator of the K-1 shock series in chunks of at most chunk_size series """
+
+    for i, start in enumerate(range(0, K-1, chunk_size)):
+        yield draw_shock_chunk(sigma_epsilon, i, min(chunk_size, K-1-start), T=T, seed=seed)
+
+def _ex_post_values_kernel(shock_series, deltas, rho, iota, R, eta, w, persistent, ex_post_value):
+    """ loop version of ex_post_values for one series at a time, compiled with numba below """
+
+    N, T = shock_series.shape
+
+    discount = np.empty(T)
+    for t in range(T):
+        discount[t] = R ** (-t)
+
+    for n in prange(N):
+
+        # the shock process does not depend on the policy
+        kappa = np.empty(T)
+        ell_star = np.empty(T)
+        revenue_star = np.empty(T)
+        log_kappa = 0.0
+        for t in range(T):
+            if persistent:
+                log_kappa = rho * log_kappa + shock_series[n, t]
+            else:
+                log_kappa = shock_series[n, t]
+            kappa[t] = np.exp(log_kappa)
+            ell_star[t] = ((1 - eta) * kappa[t] / w)**(1 / eta)
+            revenue_star[t] = kappa[t] * ell_star[t]**(1 - eta)
+
+        for d in range(deltas.size):
+            value = 0.0
+            ell_previous = 0.0
+            revenue_factor = 0.0 # ell_previous**(1-eta)
+            for t in range(T):
+                if abs(ell_previous - ell_star[t]) > deltas[d]:
+                    ell_t = ell_star[t]
+                    revenue = revenue_star[t]
+                    revenue_factor = ell_t**(1 - eta)
+                else:
+                    ell_t = ell_previous
+                    revenue = kappa[t] * revenue_factor
+
+                adjustment_cost = iota if ell_t != ell_previous else 0.0
+                value += discount[t] * (revenue - w * ell_t - adjustment_cost)
+
+                ell_previous = ell_t
+            ex_post_value[d, n] = value
+
+def _compiled_kernel():
+    """ the kernel compiled with numba, or None if numba is not installed """
+    global prange, _kernel
+
+    if _kernel is None:
+        try:
+            import numba
+        except ImportError: # the NumPy engine is used instead
+            return None
+        prange = numba.prange # looked up when the kernel is compiled
+        _kernel = numba.njit(parallel=True, cache=True)(_ex_post_values_kernel)
+
+    return _kernel
+
+def ex_post_values(shock_series, rho, iota, R, eta, w, delta=0.0, persistent=False, backend='numpy', policy=None):
+    """
+    Function to calculate the ex post value of the salon for all shock series at once
+
+    All series (and all deltas) are advanced together one period at a time.
+    The policy is to set ell_t to the optimal ell_star whenever |ell_previous - ell_star| > delta
+    and otherwise keep ell_previous, so delta = 0 is the policy of always adjusting.
+    Alternatively a policy from solve_bellman can be simulated.
+
+    Args:
+    -----
+        shock_series (ndarray): Shocks with shape (N, T)
+        rho (float): AR(1) parameter
+        iota (float): Adjustment cost
+        R (float): Discount factor
+        eta (float): Elasticity of demand
+        w (float): Wage
+        delta (float or ndarray): Threshold(s) for policy change
+        persistent (bool): If True log kappa follows the AR(1) process, otherwise
+            kappa_t = exp(shock_t) as in the original implementation where kappa_previous stays 1
+        backend (str): 'numpy' or 'numba', the latter runs a compiled loop in parallel over
+            the series and falls back to 'numpy' if numba is not installed
+        policy (SimpleNamespace): If given, delta is ignored and ell_t is set to policy.target
+            whenever ell_previous is outside [policy.lower, policy.upper], all interpolated in log kappa
+
+    Returns:
+    --------
+        ndarray: Ex post values with shape delta.shape + (N,)
+
+    """
+    kernel = _compiled_kernel() if backend == 'numba' and policy is None else None
+    if kernel is not None:
+        deltas = np.asarray(delta, dtype=float)
+        ex_post_value = np.empty((deltas.size, shock_series.shape[0]))
+        kernel(np.ascontiguousarray(shock_series, dtype=float), deltas.ravel(),
+               float(rho), float(iota), float(R), float(eta), float(w), bool(persistent), ex_post_value)
+        return ex_post_value.reshape(deltas.shape + (shock_series.shape[0],))
+    elif backend not in ('numpy', 'numba'):
+        raise ValueError(f'unknown backend {backend}')
+
+    delta = np.asarray(delta, dtype=float)[..., None]
+    N, T = shock_series.shape
+
+    ex_post_value = np.zeros(delta.shape[:-1] + (N,))
+    ell_previous = np.zeros(delta.shape[:-1] + (N,)) # starting with no employees
+    log_kappa = np.zeros(N) # initial demand shock is 1
+
+    for t in range(T):
+        if persistent:
+            log_kappa = rho * log_kappa + shock_series[:, t]
+        else:
+            log_kappa = shock_series[:, t]
+        kappa_t = np.exp(log_kappa)
+
+        ell_star = ((1 - eta) * kappa_t / w)**(1 / eta)
+        if policy is None:
+            ell_t = np.where(np.abs(ell_previous - ell_star) > delta, ell_star, ell_previous)
+        else:
+            target, lower, upper = [np.interp(log_kappa, policy.log_kappa, x) for x in (policy.target, policy.lower, policy.upper)]
+            ell_t = np.where((ell_previous < lower) | (ell_previous > upper), target, ell_previous)
+
+        adjustment_cost = iota * (ell_t != ell_previous)
+        profit = kappa_t * ell_t**(1 - eta) - w * ell_t - adjustment_cost
+        ex_post_value += R ** (-t) * profit
+
+        ell_previous = ell_t
+
+    return ex_post_value
+
+def ex_ante_value(rho, iota, sigma_epsilon, R, eta, w, K, delta=0.0, shock_series=None, persistent=False, backend='numpy', policy=None):
+    """
+    Function to calculate the ex ante value of the salon as the mean over K-1 shock series
+
+    Args:
+    -----
+        rho, iota, sigma_epsilon, R, eta, w (float): Parameters
+        K (int): Number of shock series
+        delta (float or ndarray): Threshold(s) for policy change
+        shock_series (ndarray): Shocks to use, drawn with seed 1986 if None
+        persistent (bool): See ex_post_values
+        backend (str): See ex_post_values
+        policy (SimpleNamespace): See ex_post_values
+
+    Returns:
+    --------
+        float or ndarray: Ex ante value(s) with shape delta.shape
+
+    """
+    if shock_series is None:
+        shock_series = draw_shocks(sigma_epsilon, K)
+
+    values = ex_post_values(shock_series, rho, iota, R, eta, w, delta=delta, persistent=persistent, backend=backend, policy=policy)
+
+    return np.mean(values, axis=-1)
+
+def _combine_moments(n, mean, M2, n_b, mean_b, M2_b):
+    """ combine counts, means and sums of squared deviations of two samples (Chan et al.) """
+
+    n_ab = n + n_b
+    diff = mean_b - mean
+    mean = mean + diff * n_b / n_ab
+    M2 = M2 + M2_b + diff**2 * n * n_b / n_ab
+
+    return n_ab, mean, M2
+
+def _merge_moments(n, mean, M2, values):
+    """ merge the count, mean and sum of squared deviations with a new batch of values along the last axis """
+
+    mean_b = values.mean(axis=-1)
+    M2_b = ((values - mean_b[..., None])**2).sum(axis=-1)
+
+    return _combine_moments(n, mean, M2, values.shape[-1], mean_b, M2_b)
+
+def optimize_delta(rho, iota, sigma_epsilon, R, eta, w, K, bounds=(0.01, 1), num_grid=100, shock_series=None,
+                   batch_size=1000, se_tol=None, xatol=1e-4, persistent=False, backend='numpy'):
+    """
+    Function to find the delta maximizing the ex ante value of the salon using common random numbers
+
+    The same stored shocks are used for every delta. All grid deltas are simulated in one pass over
+    batches of series, keeping running means and variances, and the pass stops early once the Monte
+    Carlo standard error of the best grid point is below se_tol. The optimum is then refined with
+    a bounded scalar optimizer between the neighbouring grid points.
+
+    Args:
+    -----
+        rho, iota, sigma_epsilon, R, eta, w (float): Parameters
+        K (int): Maximum number of shock series
+        bounds (tuple): Range of delta values
+        num_grid (int): Number of grid points in the first pass
+        shock_series (ndarray): Shocks to use, drawn with seed 1986 if None
+        batch_size (int): Number of series simulated at a time
+        se_tol (float): Stop when the standard error of the best grid point is below se_tol
+        xatol (float): Tolerance on delta in the refinement
+        persistent (bool): See ex_post_values
+        backend (str): See ex_post_values
+
+    Returns:
+    --------
+        SimpleNamespace: with delta, H and se at the optimum, the number of series used N,
+            and grid, H_grid and se_grid from the first pass
+
+    """
+    if shock_series is None:
+        shock_series = draw_shocks(sigma_epsilon, K)
+
+    res = SimpleNamespace()
+    res.grid = np.linspace(*bounds, num_grid)
+
+    # a. all grid points at once on growing batches of series
+    n, mean, M2 = 0, np.zeros(num_grid), np.zeros(num_grid)
+    for start in range(0, shock_series.shape[0], batch_size):
+        values = ex_post_values(shock_series[start:start+batch_size], rho, iota, R, eta, w,
+                                delta=res.grid, persistent=persistent, backend=backend)
+        n, mean, M2 = _merge_moments(n, mean, M2, values)
+
+        se = np.sqrt(M2 / (n - 1) / n) if n > 1 else np.full(num_grid, np.inf)
+        if se_tol is not None and se[np.argmax(mean)] < se_tol: break
+
+    res.N = n
+    res.H_grid = mean
+    res.se_grid = se
+
+    # b. refine between the neighbours of the best grid point on the same shocks
+    i = np.argmax(mean)
+    shocks_used = shock_series[:n]
+
+    def value(delta):
+        return ex_post_values(shocks_used, rho, iota, R, eta, w, delta=delta, persistent=persistent, backend=backend)
+
+    lower, upper = res.grid[max(i-1, 0)], res.grid[min(i+1, num_grid-1)]
+    sol = optimize.minimize_scalar(lambda delta: -value(delta).mean(), bounds=(lower, upper),
+                                   method='bounded', options={'xatol': xatol})
+    res.nfev = sol.nfev
+
+    # c. keep the grid point if the refinement did not improve on it
+    res.delta = sol.x if -sol.fun > mean[i] else res.grid[i]
+    values = value(res.delta)
+    res.H = values.mean()
+    res.se = values.std(ddof=1) / np.sqrt(n)
+
+    return res
+
+def _simulate_chunk(i, chunk_size, rho, iota, sigma_epsilon, R, eta, w, delta, T, seed, persistent, backend):
+    """ count, mean and sum of squared deviations of the ex post values for one chunk of shocks """
+
+    shock_series = draw_shock_chunk(sigma_epsilon, i, chunk_size, T=T, seed=seed)
+    values = ex_post_values(shock_series, rho, iota, R, eta, w, delta=delta, persistent=persistent, backend=backend)
+
+    return _merge_moments(0, 0.0, 0.0, values)
+
+def ex_ante_value_stream(rho, iota, sigma_epsilon, R, eta, w, K, delta=0.0, T=120, seed=1986, chunk_size=100_000,
+                         workers=None, persistent=False, backend='numpy'):
+    """
+    Function to calculate the ex ante value of the salon in constant memory
+
+    The K-1 shock series are drawn in chunks (see draw_shock_chunk) which are simulated and merged into
+    running means and variances, so only one chunk per process is in memory at a time. With workers the
+    chunks are simulated in a process pool of spawned processes, as a forked pool hangs at exit once
+    backend='numba' has started its threads. The chunks are merged in order, so the result does not
+    depend on the number of workers.
+
+    Returns:
+    --------
+        SimpleNamespace: with H and its Monte Carlo standard error se (shape delta.shape) and the number of series N
+
+    """
+    sizes = [min(chunk_size, K-1-start) for start in range(0, K-1, chunk_size)]
+    delta = np.asarray(delta, dtype=float)
+    args = (rho, iota, sigma_epsilon, R, eta, w, delta, T, seed, persistent, backend)
+
+    if workers is None:
+        moments = (_simulate_chunk(i, size, *args) for i, size in enumerate(sizes))
+        pool = None
+    else:
+        pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'))
+        moments = pool.map(_simulate_chunk, range(len(sizes)), sizes, *[repeat(arg) for arg in args])
+
+    n, mean, M2 = 0, np.zeros(delta.shape), np.zeros(delta.shape)
+    for moments_b in moments:
+        n, mean, M2 = _combine_moments(n, mean, M2, *moments_b)
+
+    if pool is not None: pool.shutdown()
+
+    return SimpleNamespace(H=mean, se=np.sqrt(M2 / (n - 1) / n), N=n)
+
+def rouwenhorst(rho, sigma, mu, N):
+    """
+    Function to discretize the AR(1) process x' = rho*x + e, e ~ N(mu, sigma^2), with Rouwenhorst's method
+
+    Returns:
+    --------
+        ndarray: Grid with N points
+        ndarray: Transition matrix with P[i,j] = Pr(x' = grid[j] | x = grid[i])
+
+    """
+    p = (1 + rho) / 2
+    P = np.array([[p, 1 - p], [1 - p, p]])
+    for n in range(3, N + 1):
+        P_new = np.zeros((n, n))
+        P_new[:-1, :-1] += p * P
+        P_new[:-1, 1:] += (1 - p) * P
+        P_new[1:, :-1] += (1 - p) * P
+        P_new[1:, 1:] += p * P
+        P_new[1:-1] /= 2
+        P = P_new
+
+    sd = sigma / np.sqrt(1 - rho**2)
+    grid = mu / (1 - rho) + np.linspace(-np.sqrt(N - 1) * sd, np.sqrt(N - 1) * sd, N)
+
+    return grid, P
+
+def tauchen(rho, sigma, mu, N, m=3):
+    """
+    Function to discretize the AR(1) process x' = rho*x + e, e ~ N(mu, sigma^2), with Tauchen's method on m standard deviations
+
+    Returns:
+    --------
+        ndarray: Grid with N points
+        ndarray: Transition matrix with P[i,j] = Pr(x' = grid[j] | x = grid[i])
+
+    """
+    from scipy.stats import norm
+
+    sd = sigma / np.sqrt(1 - rho**2)
+    grid = mu / (1 - rho) + np.linspace(-m * sd, m * sd, N)
+    step = grid[1] - grid[0]
+
+    z = (grid[None, :] - rho * grid[:, None] - mu) / sigma
+    cdf = norm.cdf(z + step / 2 / sigma)
+    P = np.diff(np.concatenate([np.zeros((N, 1)), cdf[:, :-1], np.ones((N, 1))], axis=1), axis=1)
+
+    return grid, P
+
+def solve_bellman(rho, iota, sigma_epsilon, R, eta, w, Nk=15, Nl=500, method='rouwenhorst', persistent=False,
+                  tol=1e-8, howard=100, max_iter=10_000):
+    """
+    Function to solve the salon's infinite horizon hiring problem on a (log kappa, ell_previous) grid
+
+    V(kappa, ell_previous) = max_ell kappa*ell**(1-eta) - w*ell - iota*(ell != ell_previous) + E[V(kappa', ell)] / R
+
+    Writing W(kappa, ell) for the value of ell without the adjustment cost, it is optimal to keep ell_previous if
+    W(kappa, ell_previous) >= max_ell W(kappa, ell) - iota and otherwise to adjust to the maximizer, the target.
+    The policy is therefore a target and an inaction band [lower, upper] for each kappa, which are interpolated
+    in log kappa when simulated. Each maximization is followed by howard evaluations of the current policy.
+
+    Args:
+    -----
+        rho, iota, sigma_epsilon, R, eta, w (float): Parameters
+        Nk (int): Number of grid points for log kappa
+        Nl (int): Number of grid points for ell
+        method (str): 'rouwenhorst' or 'tauchen'
+        persistent (bool): If False log kappa is i.i.d. as in the simulations with persistent=False
+        tol (float): Tolerance on the value function
+        howard (int): Number of policy evaluation steps per maximization
+        max_iter (int): Maximum number of maximizations
+
+    Returns:
+    --------
+        SimpleNamespace: with grids log_kappa and ell, transition matrix P, value function V,
+            policy target, lower and upper, and the number of iterations it
+
+    """
+    sol = SimpleNamespace()
+    beta = 1 / R
+
+    # a. grids
+    rho_ = rho if persistent else 0.0
+    discretize = {'rouwenhorst': rouwenhorst, 'tauchen': tauchen}[method]
+    sol.log_kappa, sol.P = discretize(rho_, sigma_epsilon, -0.5 * sigma_epsilon**2, Nk)
+    kappa = np.exp(sol.log_kappa)
+
+    ell_star = ((1 - eta) * kappa / w)**(1 / eta)
+    sol.ell = np.concatenate([[0.0], np.linspace(0.5 * ell_star.min(), 1.5 * ell_star.max(), Nl - 1)])
+
+    # b. period profit before adjustment costs
+    profit = kappa[:, None] * sol.ell[None, :]**(1 - eta) - w * sol.ell[None, :]
+
+    # c. value function iteration with howard improvement
+    V = np.zeros((Nk, Nl))
+    W = np.empty((Nk, Nl))
+    V_new = np.empty((Nk, Nl))
+    rows = np.arange(Nk)
+
+    for it in range(max_iter):
+
+        # i. maximization
+        np.matmul(sol.P, V, out=W)
+        W *= beta
+        W += profit
+        i_target = np.argmax(W, axis=1)
+        W_adjust = W[rows, i_target] - iota
+        np.maximum(W, W_adjust[:, None], out=V_new)
+
+        diff = np.max(np.abs(V_new - V))
+        V, V_new = V_new, V
+        if diff < tol * (1 - beta): break
+
+        # ii. evaluation of the policy: keep where keeping is at least as good
+        keep = W >= W_adjust[:, None]
+        for _ in range(howard):
+            np.matmul(sol.P, V, out=W)
+            W *= beta
+            W += profit
+            np.copyto(V, (W[rows, i_target] - iota)[:, None])
+            np.copyto(V, W, where=keep)
+
+    sol.V = V
+    sol.it = it
+
+    # d. policy: target and inaction band
+    keep = W >= W_adjust[:, None]
+    sol.target = sol.ell[i_target]
+    sol.lower = np.array([sol.ell[keep[i]].min() for i in range(Nk)])
+    sol.upper = np.array([sol.ell[keep[i]].max() for i in range(Nk)])
+
+    return sol
+
+def compare_bellman_delta(rho, iota, sigma_epsilon, R, eta, w, K, persistent=False, **kwargs):
+    """
+    Function to compare the policy from solve_bellman with the best delta rule from optimize_delta on the same shocks
+
+    Returns:
+    --------
+        SimpleNamespace: with H_bellman (and its standard error se_bellman), the optimize_delta result delta,
+            and the wall time of each approach
+
+    """
+    import time
+
+    shock_series = draw_shocks(sigma_epsilon, K)
+    res = SimpleNamespace()
+
+    t0 = time.perf_counter()
+    res.bellman = solve_bellman(rho, iota, sigma_epsilon, R, eta, w, persistent=persistent, **kwargs)
+    values = ex_post_values(shock_series, rho, iota, R, eta, w, persistent=persistent, policy=res.bellman)
+    res.H_bellman = values.mean()
+    res.se_bellman = values.std(ddof=1) / np.sqrt(values.size)
+    res.time_bellman = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    res.delta = optimize_delta(rho, iota, sigma_epsilon, R, eta, w, K, shock_series=shock_series, persistent=persistent)
+    res.time_delta = time.perf_counter() - t0
+
+    return res
@@ -1,11 +1,17 @@
 
 from types import SimpleNamespace
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+import copy
+import hashlib
+import os
+import tracemalloc
 
 import numpy as np
 from scipy import optimize
 
-import pandas as pd 
-import matplotlib.pyplot as plt
+from SolutionCache import SolutionCache
 
 class HouseholdSpecializationModelClass:
 
@@ -35,7 +41,17 @@ class HouseholdSpecializationModelClass:
         par.beta0_target = 0.4
         par.beta1_target = -0.1
 
-        # f. solution
+        # f. discrete solver
+        par.Nx = 49 # number of grid points in [0,24] for each choice
+        par.block_size = 2**20 # max number of choice combinations evaluated at a time
+        par.discrete_method = 'grid' # 'grid' (brute force) or 'separable' (two-stage)
+        par.screen_float32 = False # screen blocks in single precision in the 'grid' method
+        par.track_memory = False # report the peak memory of the solver in opt.peak_memory
+
+        # g. continuous solver
+        par.solve_method = 'numerical' # 'numerical' (finite differences), 'analytic' (analytic gradient) or 'hessian' (analytic gradient and hessian)
+
+        # h. solution
         sol.LM_vec = np.zeros(par.wF_vec.size)
         sol.HM_vec = np.zeros(par.wF_vec.size)
         sol.LF_vec = np.zeros(par.wF_vec.size)
@@ -44,18 +60,26 @@ class HouseholdSpecializationModelClass:
         sol.beta0 = np.nan
         sol.beta1 = np.nan
 
-    def calc_utility(self,LM,HM,LF,HF):
-        """ calculate utility """
+        sol.x_prev = None # last continuous solution, used as warm start
 
-        par = self.par
-        sol = self.sol
+        # i. cache of (beta0,beta1), least recently used first
+        self.moments_cache = OrderedDict()
+        self.moments_cache_size = 1024
 
-        # a. consumption of market goods
-        C = par.wM*LM + par.wF*LF
-        
+        # j. persistent cache of solutions (see use_cache)
+        self.cache = None
+
+        # k. tabulated moments (see build_moment_surface)
+        self.surface = None
+
+        # l. utility kernels for the current parameters (see _utility_kernel)
+        self._kernels = {}
+
+    def calc_home_production(self,HM,HF):
+        """ calculate home production """
+
+        par = self.par
 
-        # b. home production
-        
         if par.sigma == 1:
             H = HM**(1-par.alpha)*HF**par.alpha
         elif par.sigma == 0:
@@ -65,10 +89,47 @@ class HouseholdSpecializationModelClass:
         else: 
             H = ((1-par.alpha)*HM**((par.sigma-1)/par.sigma)+par.alpha*HF**((par.sigma-1)/par.sigma))**(par.sigma/(par.sigma-1))
 
+        return H
+
+    def calc_utility(self,LM,HM,LF,HF,out=None,tmp=None,dtype=np.float64):
+        """ calculate utility 
         
-            
+        The choices are broadcast against each other. out and tmp are optional buffers 
+        of the broadcast shape, the result is written to out. With dtype=np.float32 utility 
+        is evaluated in single precision, which is only accurate enough for screening.
+
+        """
 
+        # single choices, e.g. from scipy.optimize, are faster without buffers
+        if out is None and dtype is np.float64 and isinstance(LM,float) and isinstance(HM,float) \
+            and isinstance(LF,float) and isinstance(HF,float):
+            return self._calc_utility_scalar(LM,HM,LF,HF)
 
+        par = self.par
+        kernel = self._utility_kernel(dtype)
+
+        # parameters may be arrays, e.g. wages in solve_batch
+        shape = np.broadcast_shapes(np.shape(LM),np.shape(HM),np.shape(LF),np.shape(HF),np.shape(par.wM),np.shape(par.wF))
+        if out is None: out = np.empty(shape,dtype=dtype)
+        if tmp is None: tmp = np.empty(shape,dtype=dtype)
+
+        if dtype != np.float64:
+            LM,HM,LF,HF = [np.asarray(x,dtype=dtype) for x in (LM,HM,LF,HF)]
+
+        kernel(LM,HM,LF,HF,out,tmp)
+        
+        return out if shape else out[()]
+
+    def _calc_utility_scalar(self,LM,HM,LF,HF):
+        """ calculate utility allocating a new array for every operation, fastest for a single choice """
+
+        par = self.par
+
+        # a. consumption of market goods
+        C = par.wM*LM + par.wF*LF
+
+        # b. home production
+        H = self.calc_home_production(HM,HF)
 
         # c. total consumption utility
         Q = C**par.omega*H**(1-par.omega)
@@ -82,47 +143,417 @@ class HouseholdSpecializationModelClass:
         
         return utility - disutility
 
+    def _utility_kernel(self,dtype=np.float64):
+        """ utility kernel for the current sigma regime and parameters
+        
+        The kernel writes utility into out using tmp as the only scratch buffer. The arithmetic 
+        is the same as in calc_home_production so results are identical. Kernels are 
+        created once per parameter set, and only stored when all parameters are scalars.
+
+        """
+
+        par = self.par
+
+        key = (par.alpha,par.sigma,par.omega,par.rho,par.nu,par.epsilon,par.wM,par.wF,dtype)
+        cache = not any(isinstance(v,np.ndarray) for v in key)
+        if cache and key in self._kernels: return self._kernels[key]
+        
+        alpha,sigma,omega,rho,nu = par.alpha,par.sigma,par.omega,par.rho,par.nu
+        wM,wF = par.wM,par.wF
+        epsilon_ = 1+1/par.epsilon
+
+        # a. home production into out
+        # terms of each member are computed before broadcasting, as they are often vectors
+        if sigma == 1:
+            def home_production(HM,HF,out,tmp):
+                np.multiply(HM**(1-alpha),HF**alpha,out=out)
+        elif sigma == 0:
+            def home_production(HM,HF,out,tmp):
+                np.minimum(HM,HF,out=out)
+        elif sigma == 0.1:
+            def home_production(HM,HF,out,tmp):
+                np.add((1-alpha)*HM,alpha*HF,out=out)
+                np.multiply(HM,HF,out=tmp)
+                out += tmp
+        else:
+            power = (sigma-1)/sigma
+            inverse_power = sigma/(sigma-1)
+            def home_production(HM,HF,out,tmp):
+                np.add((1-alpha)*HM**power,alpha*HF**power,out=out)
+                out **= inverse_power
+
+        # b. utility
+        def kernel(LM,HM,LF,HF,out,tmp):
+
+            # i. total consumption utility
+            home_production(HM,HF,out,tmp)
+            out **= 1-omega # in-place operators keep numpy's fast paths for powers like 0.5, -1 and 2
+            np.add(wM*LM,wF*LF,out=tmp)
+            tmp **= omega
+            np.multiply(tmp,out,out=out)
+            np.fmax(out,1e-8,out=out)
+            out **= 1-rho
+            out /= 1-rho
+
+            # ii. disutility of work
+            TM = LM+HM
+            TF = LF+HF
+            np.add(TM**epsilon_/epsilon_,TF**epsilon_/epsilon_,out=tmp)
+            tmp *= nu
+            out -= tmp
+
+        if cache:
+            if len(self._kernels) >= 64: self._kernels.clear() # e.g. when estimating
+            self._kernels[key] = kernel
+
+        return kernel
+
+    def calc_home_production_derivatives(self,HM,HF):
+        """ calculate first and second derivatives of home production """
+
+        par = self.par
+
+        H = self.calc_home_production(HM,HF)
+        zero = np.zeros_like(H)
+
+        if par.sigma == 1:
+            H_M = (1-par.alpha)*H/HM
+            H_F = par.alpha*H/HF
+            H_MM = -par.alpha*H_M/HM
+            H_FF = -(1-par.alpha)*H_F/HF
+            H_MF = H_M*H_F/H
+        elif par.sigma == 0: # kinked, one-sided derivatives are averaged at HM = HF
+            H_M = np.where(HM < HF,1.0,np.where(HM == HF,0.5,0.0))
+            H_F = 1.0-H_M
+            H_MM = H_FF = H_MF = zero
+        elif par.sigma == 0.1:
+            H_M = 1-par.alpha+HF+zero
+            H_F = par.alpha+HM+zero
+            H_MM = H_FF = zero
+            H_MF = 1.0+zero
+        else:
+            r = (par.sigma-1)/par.sigma
+            a = (1-par.alpha)*HM**(r-1)
+            b = par.alpha*HF**(r-1)
+            S = (1-par.alpha)*HM**r+par.alpha*HF**r
+            H_M = H*a/S
+            H_F = H*b/S
+            H_MM = (1-r)*H_M*(a/S-1/HM)
+            H_FF = (1-r)*H_F*(b/S-1/HF)
+            H_MF = (1-r)*H*a*b/S**2
+
+        return H,H_M,H_F,H_MM,H_MF,H_FF
+
+    def calc_utility_derivatives(self,LM,HM,LF,HF):
+        """ calculate gradient and hessian of utility wrt. (LM,HM,LF,HF) """
+
+        par = self.par
+
+        # a. consumption and home production
+        C = par.wM*LM + par.wF*LF
+        H,H_M,H_F,H_MM,H_MF,H_FF = self.calc_home_production_derivatives(HM,HF)
+
+        # b. derivatives of consumption utility wrt. C and H (zero where Q is floored)
+        Q = C**par.omega*H**(1-par.omega)
+        I = Q > 1e-8
+        with np.errstate(divide='ignore',invalid='ignore'):
+            U1 = np.where(I,Q**(-par.rho),0.0)
+            U2 = np.where(I,-par.rho*Q**(-par.rho-1),0.0)
+            Q_C = par.omega*Q/C
+            Q_H = (1-par.omega)*Q/H
+            V_C = np.where(I,U1*Q_C,0.0)
+            V_H = np.where(I,U1*Q_H,0.0)
+            V_CC = np.where(I,U2*Q_C**2 + U1*(par.omega-1)*Q_C/C,0.0)
+            V_HH = np.where(I,U2*Q_H**2 - U1*par.omega*Q_H/H,0.0)
+            V_CH = np.where(I,U2*Q_C*Q_H + U1*(1-par.omega)*Q_C/H,0.0)
+
+        # c. derivatives of disutility wrt. total hours
+        epsilon_ = 1+1/par.epsilon
+        TM = LM+HM
+        TF = LF+HF
+        DM = par.nu*TM**(epsilon_-1)
+        DF = par.nu*TF**(epsilon_-1)
+        DMM = par.nu*(epsilon_-1)*TM**(epsilon_-2)
+        DFF = par.nu*(epsilon_-1)*TF**(epsilon_-2)
+
+        # d. gradient
+        grad = np.stack(np.broadcast_arrays(
+            V_C*par.wM - DM,
+            V_H*H_M - DM,
+            V_C*par.wF - DF,
+            V_H*H_F - DF),axis=-1)
+
+        # e. hessian
+        h = np.broadcast_arrays(
+            V_CC*par.wM**2 - DMM, # LM,LM
+            V_CH*par.wM*H_M - DMM, # LM,HM
+            V_CC*par.wM*par.wF, # LM,LF
+            V_CH*par.wM*H_F, # LM,HF
+            V_HH*H_M**2 + V_H*H_MM - DMM, # HM,HM
+            V_CH*H_M*par.wF, # HM,LF
+            V_HH*H_M*H_F + V_H*H_MF, # HM,HF
+            V_CC*par.wF**2 - DFF, # LF,LF
+            V_CH*par.wF*H_F - DFF, # LF,HF
+            V_HH*H_F**2 + V_H*H_FF - DFF) # HF,HF
+        
+        iu = np.triu_indices(4)
+        hess = np.zeros(grad.shape+(4,))
+        hess[...,iu[0],iu[1]] = np.stack(h,axis=-1)
+        hess[...,iu[1],iu[0]] = np.stack(h,axis=-1)
+
+        return grad,hess
+
+    def feasible_choices(self):
+        """ feasible (L,H) pairs on the discrete grid for one household member """
+
+        par = self.par
+
+        # a. grid for hours
+        x = np.linspace(0,24,par.Nx)
+
+        # b. only keep L+H <= 24 (in indices to avoid rounding issues on fine grids)
+        iH,iL = np.meshgrid(np.arange(par.Nx),np.arange(par.Nx),indexing='ij')
+        I = iL+iH <= par.Nx-1
+
+        return x[iL[I]],x[iH[I]]
+
     def solve_discrete(self,do_print=False):
         """ solve model discretely """
         
         par = self.par
         sol = self.sol
+
+        # a. track memory used by the solver
+        if par.track_memory:
+            tracing = tracemalloc.is_tracing()
+            if not tracing: tracemalloc.start()
+            mem_start = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+
+        # b. solve
+        if par.discrete_method == 'grid':
+            opt = self._cached('solve_discrete',self._solve_discrete_grid)
+        elif par.discrete_method == 'separable':
+            opt = self._cached('solve_discrete',self._solve_discrete_separable)
+        else:
+            raise ValueError(f'unknown discrete_method: {par.discrete_method}')
+
+        # c. peak memory in MB
+        if par.track_memory:
+            opt.peak_memory = (tracemalloc.get_traced_memory()[1]-mem_start)/1e6
+            if not tracing: tracemalloc.stop()
+
+        # d. print
+        if do_print:
+            for k,v in opt.__dict__.items():
+                print(f'{k} = {v:6.4f}')
+
+        return opt
+
+    def _discrete_tables(self):
+        """ feasible choices and block buffers of the grid solver, which only depend on Nx, block_size and screen_float32 """
+
+        par = self.par
+        tables = SimpleNamespace()
+
+        # a. feasible choices for each member (the time constraints hold by construction)
+        tables.LM,tables.HM = self.feasible_choices() # ordered by HM then LM
+        tables.HF,tables.LF = self.feasible_choices() # ordered by LF then HF
+
+        # b. buffers reused by all blocks
+        tables.rows = max(par.block_size//tables.LF.size,1) # male choices per block
+        tables.dtype = np.float32 if par.screen_float32 else np.float64
+        tables.out = np.empty((min(tables.rows,tables.LM.size),tables.LF.size),dtype=tables.dtype)
+        tables.tmp = np.empty_like(tables.out)
+
+        return tables
+
+    def _solve_discrete_grid(self,tables=None):
+        """ solve model discretely by brute force over all feasible choices (tables from _discrete_tables) """
+
+        par = self.par
         opt = SimpleNamespace()
         
-        # a. all possible choices
-        x = np.linspace(0,24,49)
-        LM,HM,LF,HF = np.meshgrid(x,x,x,x) # all combinations
-    
-        LM = LM.ravel() # vector
-        HM = HM.ravel()
-        LF = LF.ravel()
-        HF = HF.ravel()
+        # a. feasible choices and buffers
+        if tables is None: tables = self._discrete_tables()
+        LM,HM,LF,HF = tables.LM,tables.HM,tables.LF,tables.HF
+        rows,dtype,out,tmp = tables.rows,tables.dtype,tables.out,tables.tmp
 
-        # b. calculate utility
-        u = self.calc_utility(LM,HM,LF,HF)
-    
-        # c. set to minus infinity if constraint is broken
-        I = (LM+HM > 24) | (LF+HF > 24) # | is "or"
-        u[I] = -np.inf
-    
-        # d. find maximizing argument
-        j = np.argmax(u)
+        # b. walk through male choices in blocks and keep a running argmax
+        u_max = -np.inf
+        for i0 in range(0,LM.size,rows):
+
+            i1 = min(i0+rows,LM.size)
+            u = self.calc_utility(LM[i0:i1,np.newaxis],HM[i0:i1,np.newaxis],LF[np.newaxis,:],HF[np.newaxis,:],
+                                  out=out[:i1-i0],tmp=tmp[:i1-i0],dtype=dtype)
+
+            if par.screen_float32:
+                j,u_j = self._screen_block(u,LM[i0:i1],HM[i0:i1],LF,HF)
+            else:
+                j = np.argmax(u)
+                u_j = u.flat[j]
+
+            if u_j > u_max:
+                u_max = u_j
+                iM,iF = np.unravel_index(j,u.shape)
+                iM += i0
+
+        # c. find maximizing argument
+        opt.LM = LM[iM]
+        opt.HM = HM[iM]
+        opt.LF = LF[iF]
+        opt.HF = HF[iF]
+
+        return opt
+
+    def _screen_block(self,u,LM,HM,LF,HF):
+        """ exact argmax and maximum of a block from its single precision utility u 
+        
+        The choices within the single precision error of the best are evaluated in double precision,
+        ties are broken in grid order as np.argmax does.
+
+        """
+
+        best = u.max()
+        if np.isfinite(best):
+            I = np.flatnonzero(u >= best - 1e-5*abs(best))
+        else: # overflow in single precision, evaluate the whole block exactly
+            I = np.arange(u.size)
+
+        iM,iF = np.unravel_index(I,u.shape)
+        u_exact = self.calc_utility(LM[iM],HM[iM],LF[iF],HF[iF])
+        j = np.argmax(u_exact)
+
+        return I[j],u_exact[j]
+
+    def _solve_discrete_separable(self):
+        """ solve model discretely in two stages 
+        
+        For given home production (HM,HF) utility is concave in LF and 
+        has decreasing differences in (LM,LF), so the largest optimal LF is 
+        nonincreasing in LM. For each (HM,HF) the best LF is found by bisection 
+        for LM = 0 and then by walking down as LM increases. Utility is 
+        evaluated from per-person tables, and only the near-optimal
+        candidates are finally compared using calc_utility.
+
+        """
+
+        par = self.par
+        opt = SimpleNamespace()
+
+        # a. grid
+        x = np.linspace(0,24,par.Nx)
+        iLF_max = par.Nx-1-np.arange(par.Nx)[np.newaxis,:] # LF+HF <= 24
+        iLM_max = par.Nx-1-np.arange(par.Nx) # LM+HM <= 24
+
+        # b. tables: log C over (LM,LF), log H over (HM,HF) and disutility over (L,H)
+        with np.errstate(divide='ignore'):
+            logC = np.log(par.wM*x[:,np.newaxis] + par.wF*x[np.newaxis,:])
+            logH = np.log(self.calc_home_production(x[:,np.newaxis],x[np.newaxis,:]))
+
+        epsilon_ = 1+1/par.epsilon
+        T = x[:,np.newaxis]+x[np.newaxis,:]
+        D = par.nu*T**epsilon_/epsilon_
+
+        logQ_min = np.log(1e-8)
+        def u_table(iHM,iHF,iLM,iLF):
+            logQ = np.fmax(par.omega*logC[iLM,iLF]+(1-par.omega)*logH[iHM,iHF],logQ_min)
+            return np.exp((1-par.rho)*logQ)/(1-par.rho) - D[iLM,iHM] - D[iLF,iHF]
+
+        # c. loop over blocks of HM (rows) x HF (columns)
+        rows = max(par.block_size//par.Nx,1)
+        steps = int(np.ceil(np.log2(par.Nx)))
+        tol = lambda u: u-1e-10*(1+abs(u)) # margin for rounding errors in the tables
+
+        cands = []
+        u_max = -np.inf
+        for i0 in range(0,par.Nx,rows):
+
+            iHM = np.arange(i0,min(i0+rows,par.Nx))[:,np.newaxis]
+            iHF = np.arange(par.Nx)[np.newaxis,:]
+            shape = (iHM.size,par.Nx)
+
+            # i. LM = 0: bisection for the last LF where utility is still increasing
+            lo = np.zeros(shape,dtype=int)
+            hi = np.broadcast_to(iLF_max,shape).copy()
+            for _ in range(steps):
+                mid = (lo+hi)//2
+                I = u_table(iHM,iHF,0,np.minimum(mid+1,hi)) >= u_table(iHM,iHF,0,mid)
+                lo = np.where(I&(lo<hi),mid+1,lo)
+                hi = np.where(I,hi,mid)
+            
+            p = lo
+            u_p = u_table(iHM,iHF,0,p)
+
+            # ii. LM > 0: walk down from the previous best LF
+            for iLM in range(par.Nx):
+
+                if iLM > 0:
+                    u_p = u_table(iHM,iHF,iLM,p)
+                    while True:
+                        u_down = u_table(iHM,iHF,iLM,np.maximum(p-1,0))
+                        I = (p > 0) & (u_down > u_p)
+                        if not I.any(): break
+                        p = np.where(I,p-1,p)
+                        u_p = np.where(I,u_down,u_p)
+
+                # iii. keep near-optimal candidates
+                u = np.where(iLM > iLM_max[iHM],-np.inf,u_p)
+                u_max = max(u_max,u.max())
+                I = u >= tol(u_max)
+                if I.any():
+                    jHM,jHF = np.nonzero(I)
+                    cands.append((iHM[jHM,0],jHF,np.full(jHF.size,iLM),p[I],u[I]))
+
+        # d. drop candidates found before the best
+        iHM,iHF,iLM,iLF,u = [np.concatenate(c) for c in zip(*cands)]
+        I = u >= tol(u_max)
+        iHM,iHF,iLM,iLF = iHM[I],iHF[I],iLM[I],iLF[I]
+
+        # e. compare candidates and their LF neighbours with the exact utility
+        iHM,iHF,iLM = [np.tile(i,3) for i in (iHM,iHF,iLM)]
+        iLF = np.concatenate([iLF-1,iLF,iLF+1])
+        I = (iLF >= 0) & (iLF <= par.Nx-1-iHF)
+        iHM,iHF,iLM,iLF = iHM[I],iHF[I],iLM[I],iLF[I]
         
-        opt.LM = LM[j]
-        opt.HM = HM[j]
-        opt.LF = LF[j]
-        opt.HF = HF[j]
+        u = self.calc_utility(x[iLM],x[iHM],x[iLF],x[iHF])
+
+        # f. find maximizing argument with ties broken in the same order as the grid solver
+        order = np.lexsort((iHF,iLF,iLM,iHM))
+        j = order[np.argmax(u[order])]
+        
+        opt.LM = x[iLM[j]]
+        opt.HM = x[iHM[j]]
+        opt.LF = x[iLF[j]]
+        opt.HF = x[iHF[j]]
+
+        return opt
+
+
+    def solve(self,do_print=False):
+        """ solve model continously 
+        
+        par.solve_method = 'analytic' uses SLSQP with the analytic gradient and the 
+        time constraints, and 'hessian' uses Newton's method with the analytic hessian 
+        (falling back to 'analytic' if a time constraint binds). Both start from the
+        previous solution. The iteration and evaluation counts are returned in opt.
+
+        """
+
+        sol = self.sol
+
+        opt = self._cached('solve',self._solve)
+        sol.x_prev = np.array([opt.LM,opt.HM,opt.LF,opt.HF])
 
-        # e. print
         if do_print:
             for k,v in opt.__dict__.items():
                 print(f'{k} = {v:6.4f}')
 
         return opt
 
+    def _solve(self):
+        """ solve model continously (see solve) """
 
-    def solve(self,do_print=False):
-        """ solve model continously """
         par = self.par
         sol = self.sol
         opt = SimpleNamespace()
@@ -134,45 +565,237 @@ class HouseholdSpecializationModelClass:
         
     
         obj = lambda x: - 100*objective(x) #We make a positive monotone transformation, in order to ensure the stability of the SLSQP method, which is sensitive to starting values. we call a minimizer later, but we want to maximize so minus in front of obj. func. 
-        guess = [(3,5.0,5.5,4.0)]
+        guess = [3,5.0,5.5,4.0]
         bounds = [(0,24),(0,24),(0,24),(0,24)] 
         def con1(x):
-            LM, HM= x
+            LM, HM = x[:2]
             return 24 - (LM + HM) # TM = LM + HM constraint - not to be broken
         def con2(x):
-            LF, HF = x
+            LF, HF = x[2:]
             return 24 - (LF + HF) # TF = LF + HF contraint - not to be broken
         
-        contraints = ({'type':'ineq', 'fun': con1},{'type':'ineq', 'fun': con2})
+        contraints = ({'type':'ineq', 'fun': con1, 'jac': lambda x: np.array([-1.0,-1.0,0.0,0.0])},
+                      {'type':'ineq', 'fun': con2, 'jac': lambda x: np.array([0.0,0.0,-1.0,-1.0])})
+
+        #optimizer (utility is not differentiable with sigma = 0)
+        if par.solve_method == 'numerical' or par.sigma == 0:
+
+            res = optimize.minimize(obj,
+                                     guess,
+                                     method='SLSQP',
+                                     bounds=bounds 
+                                     )
+
+        elif par.solve_method in ['analytic','hessian']:
+
+            # warm start from the previous solution and keep home production positive
+            if sol.x_prev is not None: guess = sol.x_prev
+            bounds = [(0,24),(1e-8,24),(0,24),(1e-8,24)]
+
+            jac = lambda x: -100*self.calc_utility_derivatives(*x)[0]
+
+            res = None
+            if par.solve_method == 'hessian':
+                x,converged,nit,nfev = self._solve_newton(np.atleast_2d(guess))
+                if converged[0]:
+                    res = optimize.OptimizeResult(x=x[0],nit=nit,nfev=nfev,njev=nit,nhev=nit)
+
+            if res is None:
+                res = optimize.minimize(obj,
+                                         guess,
+                                         method='SLSQP',
+                                         jac=jac,
+                                         bounds=bounds,
+                                         constraints=contraints
+                                         )
+
+        else:
+            raise ValueError(f'unknown solve_method: {par.solve_method}')
 
-        #optimizer
-        res = optimize.minimize(obj,
-                                 guess,
-                                 method='SLSQP',
-                                 bounds=bounds 
-                                 )
         opt.LM = res.x[0]
         opt.HM = res.x[1]
         opt.LF = res.x[2]
         opt.HF = res.x[3]
 
+        # counters
+        opt.nit = res.nit
+        opt.nfev = res.nfev
+        opt.njev = res.get('njev',0)
+        opt.nhev = res.get('nhev',0)
+
         return opt
 
 
+    def _solve_newton(self,x,tol=1e-10,max_iter=100):
+        """ solve model continuously for many wages at once with damped Newton steps
+        
+        x is an (m,4) array of starting values for (LM,HM,LF,HF) and the wages in par
+        can be arrays broadcasting against m. Market hours are projected onto zero and
+        choices at zero with a negative derivative are kept fixed. Returns the solutions and a mask for those where 
+        the Karush-Kuhn-Tucker conditions hold with none of the time constraints binding,
+        together with the number of iterations and utility evaluations.
+
+        """
+
+        x = x.copy()
+        converged = np.zeros(x.shape[0],dtype=bool)
+        nfev = 0
+
+        for it in range(max_iter):
+
+            with np.errstate(all='ignore'):
+
+                # a. check KKT conditions
+                grad,hess = self.calc_utility_derivatives(*x.T)
+                fixed = (x <= 1e-12) & (grad <= 0)
+                x[fixed] = 0.0
+                converged = np.all(fixed | (np.abs(grad) < tol),axis=1)
+                if converged.all(): break
+
+                u = self.calc_utility(*x.T)
+                nfev += 1
+
+                # b. Newton direction for the free choices, gradient direction if it is not uphill
+                free = ~fixed
+                grad = np.where(fixed,0.0,grad)
+                hess = hess*free[:,:,np.newaxis]*free[:,np.newaxis,:]
+                i,j = np.nonzero(fixed)
+                hess[i,j,j] = -1.0
+
+                try:
+                    d = np.linalg.solve(hess,-grad[...,np.newaxis])[...,0]
+                except np.linalg.LinAlgError:
+                    d = grad.copy()
+                slope = np.sum(grad*d,axis=1)
+                I = ~(slope > 0)
+                d[I] = grad[I]
+                slope[I] = np.sum(grad[I]**2,axis=1)
+
+                # c. longest step keeping home production positive and within the time constraints
+                t_max = np.where(d[:,1::2] < 0,-x[:,1::2]/np.where(d[:,1::2] < 0,d[:,1::2],-1.0),np.inf).min(axis=1)
+                for i,j in [(0,1),(2,3)]:
+                    dT = d[:,i]+d[:,j]
+                    t_max = np.fmin(t_max,np.where(dT > 0,(24-x[:,i]-x[:,j])/dT,np.inf))
+                t = np.fmin(1.0,0.99*t_max)
+
+                # d. backtrack along the projection of market hours onto zero until utility increases (up to rounding)
+                todo = ~converged
+                u_tol = 4*np.finfo(float).eps*np.abs(u)
+                for _ in range(50):
+                    x_new = x+t[:,np.newaxis]*d
+                    x_new[:,0::2] = np.fmax(x_new[:,0::2],0.0)
+                    ok = self.calc_utility(*x_new.T) >= u + 1e-4*np.sum(grad*(x_new-x),axis=1) - u_tol
+                    nfev += 1
+                    if not np.any(todo & ~ok): break
+                    t[todo & ~ok] /= 2
+
+                x[todo] = x_new[todo]
+
+        return x,converged,it,nfev
+
+    def _copy(self,**kwargs):
+        """ copy of the model with some parameters replaced and its own sol """
+
+        model = copy.copy(self)
+        model.par = SimpleNamespace(**vars(self.par))
+        model.sol = SimpleNamespace(**vars(self.sol))
+        for k,v in kwargs.items():
+            setattr(model.par,k,v)
+
+        return model
+
+    def solve_batch(self,wF=None,wM=None,alpha=None,sigma=None,discrete=False):
+        """ solve model for arrays of (wF,wM,alpha,sigma) broadcasting against each other
+        
+        Parameters not given are taken from par. In the continuous case par.solve_method
+        is followed: with 'hessian' scenarios with the same (alpha,sigma) are solved together 
+        with Newton's method, and scenarios without an interior solution (or with sigma = 0) 
+        fall back to solve(). Otherwise each scenario is solved with solve() in turn, warm 
+        started from the previous scenario with the same (alpha,sigma), and the first from 
+        the default guess, so the results do not depend on earlier calls and sol is not 
+        changed. The total number of utility evaluations is returned in opt.nfev. In the 
+        discrete case with the 'grid' method the feasible choices and block buffers are 
+        built once and the scenarios are solved one at a time on them, as a scenario 
+        needs a full pass over the grid anyway.
+
+        """
+
+        par = self.par
+        opt = SimpleNamespace()
+
+        # a. broadcast scenarios
+        wF,wM,alpha,sigma = np.broadcast_arrays(*[np.asarray(par_ if v is None else v,dtype=float) 
+            for v,par_ in [(wF,par.wF),(wM,par.wM),(alpha,par.alpha),(sigma,par.sigma)]])
+        shape = wF.shape
+        wF,wM,alpha,sigma = [v.ravel() for v in (wF,wM,alpha,sigma)]
+        x = np.zeros((wF.size,4))
+        opt.nfev = 0
+
+        # b. solve
+        if discrete:
+
+            tables = self._discrete_tables() if par.discrete_method == 'grid' else None
+            for i in range(wF.size):
+                model = self._copy(wF=wF[i],wM=wM[i],alpha=alpha[i],sigma=sigma[i])
+                if tables is None:
+                    res = model.solve_discrete()
+                else:
+                    res = model._cached('solve_discrete',lambda: model._solve_discrete_grid(tables))
+                x[i] = res.LM,res.HM,res.LF,res.HF
+
+        elif par.solve_method != 'hessian':
+
+            pars,group = np.unique(np.stack([alpha,sigma],axis=1),axis=0,return_inverse=True)
+            group = group.ravel()
+            for k,(alpha_,sigma_) in enumerate(pars):
+
+                model = self._copy(alpha=alpha_,sigma=sigma_) # solve() keeps the warm start in sol.x_prev
+                model.sol.x_prev = None
+                for i in np.flatnonzero(group == k):
+                    model.par.wF,model.par.wM = wF[i],wM[i]
+                    res = model.solve()
+                    x[i] = res.LM,res.HM,res.LF,res.HF
+                    opt.nfev += res.nfev
+
+        else:
+
+            pars,group = np.unique(np.stack([alpha,sigma],axis=1),axis=0,return_inverse=True)
+            group = group.ravel()
+            for k,(alpha_,sigma_) in enumerate(pars):
+                
+                I = np.flatnonzero(group == k)
+                model = self._copy(wF=wF[I],wM=wM[I],alpha=alpha_,sigma=sigma_)
+
+                # i. all wages at once
+                converged = np.zeros(I.size,dtype=bool)
+                if sigma_ != 0:
+                    x0 = np.tile([3,5.0,5.5,4.0],(I.size,1))
+                    x[I],converged,_,nfev = model._solve_newton(x0)
+                    opt.nfev += nfev
+
+                # ii. one at a time
+                for i in I[~converged]:
+                    model = self._copy(wF=wF[i],wM=wM[i],alpha=alpha_,sigma=sigma_)
+                    model.sol.x_prev = None
+                    res = model.solve()
+                    x[i] = res.LM,res.HM,res.LF,res.HF
+                    opt.nfev += res.nfev
+
+        opt.LM,opt.HM,opt.LF,opt.HF = [x[:,j].reshape(shape) for j in range(4)]
+        
+        return opt
+
     def solve_wF_vec(self,discrete=False):
         """ solve model for vector of female wages """
+
         par = self.par
         sol = self.sol
-        for it, w in enumerate(par.wF_vec):
-            par.wF = w 
-            if discrete == True:
-                res = self.solve_discrete()
-            else:
-                res = self.solve()
-            sol.LM_vec[it] = res.LM
-            sol.LF_vec[it] = res.LF
-            sol.HM_vec[it] = res.HM
-            sol.HF_vec[it] = res.HF
+
+        res = self._cached(f'solve_wF_vec_{discrete}',lambda: self.solve_batch(wF=par.wF_vec,discrete=discrete))
+        sol.LM_vec = res.LM
+        sol.LF_vec = res.LF
+        sol.HM_vec = res.HM
+        sol.HF_vec = res.HF
 
    
     def run_regression(self):
@@ -186,45 +809,291 @@ class HouseholdSpecializationModelClass:
         A = np.vstack([np.ones(x.size),x]).T
         sol.beta0,sol.beta1 = np.linalg.lstsq(A,y,rcond=None)[0]
     
-    def estimate(self,alpha=None,sigma=None,do_print=False):
-        """ estimate alpha and sigma """
+    def _par_key(self,exclude=()):
+        """ hashable summary of par """
+
+        key = []
+        for k,v in sorted(vars(self.par).items()):
+            if k in exclude: continue
+            if isinstance(v,np.ndarray): v = (v.dtype.str,v.shape,v.tobytes())
+            key.append((k,v))
+
+        return tuple(key)
+
+    def use_cache(self,path,max_bytes=2**30):
+        """ store solutions persistently in an SQLite file at path 
+        
+        Solutions are keyed by par and the solver, and entries are invalidated when
+        this file changes.
+
+        """
+
+        self.cache = SolutionCache(path,_code_version(),max_bytes=max_bytes)
+
+    def _cached(self,mode,func):
+        """ call func or look up its result in the persistent cache """
+
+        if self.cache is None: return func()
+
+        key = self.cache.key(mode,self._par_key())
+        opt = self.cache.get(key)
+        if opt is None:
+            opt = func()
+            self.cache.put(key,opt)
+
+        return opt
+
+    def _moments_key(self,alpha,sigma,discrete):
+        """ key in the moments cache """
+
+        return (float(alpha),float(sigma),discrete,self._par_key(exclude=('alpha','sigma')))
+
+    def _store_moments(self,key,moments):
+        """ store moments in the LRU cache """
+
+        self.moments_cache[key] = moments
+        self.moments_cache.move_to_end(key)
+        while len(self.moments_cache) > self.moments_cache_size:
+            self.moments_cache.popitem(last=False)
+
+    def calc_moments(self,alpha,sigma,discrete=False,pool=None):
+        """ calculate (beta0,beta1) for given alpha and sigma 
+        
+        Results are cached. With a process pool the wages in par.wF_vec are solved in chunks
+        by the workers.
+
+        """
+
         par = self.par
         sol = self.sol
-        opt = SimpleNamespace()
-        model = HouseholdSpecializationModelClass()
-        model.par.alpha = alpha
-        model.par.sigma = sigma
 
-        # values from study
-        beta0_study= 0.4
-        beta1_study= -0.1
+        # a. look up
+        key = self._moments_key(alpha,sigma,discrete)
+        if key in self.moments_cache:
+            self.moments_cache.move_to_end(key)
+            return self.moments_cache[key]
+
+        # b. solve for all wages
+        model = self._copy(alpha=alpha,sigma=sigma)
+        if pool is None:
+            res = model.solve_batch(wF=par.wF_vec,discrete=discrete)
+            x = np.array([res.LM,res.HM,res.LF,res.HF])
+        else:
+            chunks = np.array_split(par.wF_vec,min(par.wF_vec.size,os.cpu_count()))
+            x = np.concatenate(list(pool.map(_solve_wF_chunk,repeat(model.par),chunks,repeat(discrete))),axis=1)
+
+        sol.LM_vec,sol.HM_vec,sol.LF_vec,sol.HF_vec = x
+
+        # c. regression
+        self.run_regression()
+        moments = (sol.beta0,sol.beta1)
+        self._store_moments(key,moments)
+
+        return moments
+
+    def estimate(self,alpha=None,sigma=None,do_print=False,discrete=False,workers=None,grid=None,digits=10):
+        """ estimate alpha and sigma 
+        
+        alpha and sigma are the starting values (0.5 if not given). With grid = (alpha_grid,sigma_grid) 
+        the objective is first evaluated on the grid and the best point is used as starting value. 
+        With workers the model is solved in a process pool. The moments are cached for (alpha,sigma)
+        rounded to digits decimals, so points revisited by the simplex are not solved again.
+
+        """
+        par = self.par
+        sol = self.sol
+        opt = SimpleNamespace()
 
         # some initial guess for alpha and sigma values that minimize obj function
-        alpha_guess = 0.5
-        sigma_guess = 0.5
+        alpha_guess = 0.5 if alpha is None else alpha
+        sigma_guess = 0.5 if sigma is None else sigma
         guess = (alpha_guess, sigma_guess)
 
+        pool = None if workers is None else ProcessPoolExecutor(workers)
+        opt.nsolve = 0 # number of times the model is solved
+
         # obj to be minimized
         def objective(x):
-            par.alpha, par.sigma = x
-            self.solve_wF_vec()
-            self.run_regression()
-            value = (beta0_study-sol.beta0)**2 + (beta1_study-sol.beta1)**2
+            alpha,sigma = np.round(x,digits)
+            opt.nsolve += self._moments_key(alpha,sigma,discrete) not in self.moments_cache
+            beta0,beta1 = self.calc_moments(alpha,sigma,discrete=discrete,pool=pool)
+            value = (par.beta0_target-beta0)**2 + (par.beta1_target-beta1)**2
             return value
 
-        obj = lambda x: objective(x)
+        try:
+
+            # coarse grid, with one grid point per task if there is a pool
+            if grid is not None:
+
+                alphas,sigmas = [np.round(x.ravel(),digits) for x in np.meshgrid(*grid,indexing='ij')]
+                if pool is not None:
+                    keys = [self._moments_key(alpha_,sigma_,discrete) for alpha_,sigma_ in zip(alphas,sigmas)]
+                    I = [i for i,key in enumerate(keys) if key not in self.moments_cache]
+                    moments = pool.map(_calc_moments,repeat(par),alphas[I],sigmas[I],repeat(discrete))
+                    for i,moments_ in zip(I,moments):
+                        self._store_moments(keys[i],moments_)
+                    opt.nsolve += len(I)
+
+                values = [objective(x) for x in zip(alphas,sigmas)]
+                i = np.nanargmin(values)
+                guess = (alphas[i],sigmas[i])
         
-        # call minimizer and store results
-        res = optimize.minimize(obj,
-                                x0=guess,
-                                method='Nelder-Mead'
-                                )
+            # call minimizer and store results
+            res = optimize.minimize(objective,
+                                    x0=guess,
+                                    method='Nelder-Mead'
+                                    )
+
+        finally:
+            if pool is not None: pool.shutdown()
+
         opt.alpha = res.x[0]
         opt.sigma = res.x[1]
+        opt.nfev = res.nfev
+        par.alpha,par.sigma = opt.alpha,opt.sigma
 
         if do_print:
-            for k,v in opt.__dict__.items():
-                print(f'optimal {k} = {v:6.4f}')
+            for k in ['alpha','sigma']:
+                print(f'optimal {k} = {getattr(opt,k):6.4f}')
+
+        return opt
+
+    def _surface_key(self,discrete):
+        """ the surface depends on par except alpha, sigma and the targets, and on the model code """
+
+        key = (_code_version(),discrete,self._par_key(exclude=('alpha','sigma','beta0_target','beta1_target')))
+
+        return hashlib.sha256(repr(key).encode()).hexdigest()
+
+    def build_moment_surface(self,alpha_grid=None,sigma_grid=None,discrete=False,workers=None,path=None):
+        """ tabulate (beta0,beta1) on an (alpha,sigma) grid 
+        
+        The grid points are solved in a process pool with workers. The surface is stored in 
+        self.surface and, if path is given, saved compressed to path (.npz). The grid should 
+        not contain sigma = 0.1, where calc_home_production uses another functional form.
+
+        """
+
+        alpha_grid = 1/(1+np.exp(-np.linspace(-3,6,40))) if alpha_grid is None else np.asarray(alpha_grid,dtype=float) # even in log(alpha/(1-alpha))
+        sigma_grid = np.geomspace(0.02,2.0,40) if sigma_grid is None else np.asarray(sigma_grid,dtype=float)
+
+        alphas,sigmas = [x.ravel() for x in np.meshgrid(alpha_grid,sigma_grid,indexing='ij')]
+        if workers is None:
+            moments = [self.calc_moments(alpha,sigma,discrete=discrete) for alpha,sigma in zip(alphas,sigmas)]
+        else:
+            with ProcessPoolExecutor(workers) as pool:
+                moments = list(pool.map(_calc_moments,repeat(self.par),alphas,sigmas,repeat(discrete),chunksize=16))
+
+        beta0,beta1 = np.array(moments).T.reshape(2,alpha_grid.size,sigma_grid.size)
+        self.surface = SimpleNamespace(alpha_grid=alpha_grid,sigma_grid=sigma_grid,beta0=beta0,beta1=beta1,
+                                       discrete=discrete,key=self._surface_key(discrete))
+
+        if path is not None:
+            np.savez_compressed(path,**vars(self.surface))
+
+        return self.surface
+
+    def load_moment_surface(self,path,discrete=False):
+        """ load a surface saved by build_moment_surface, it must match par and the model code """
+
+        with np.load(path,allow_pickle=False) as f:
+            surface = SimpleNamespace(**{k:f[k][()] if f[k].ndim == 0 else f[k] for k in f.files})
+
+        if surface.key != self._surface_key(discrete):
+            raise ValueError(f'{path} was built for other parameters or another version of the model')
+
+        self.surface = surface
+
+        return surface
+
+    def estimate_surface(self,polish=2,do_print=False):
+        """ estimate alpha and sigma using the interpolated moment surface 
+        
+        The squared distance to the targets is minimized on a bicubic spline of the surface,
+        starting from the best grid point. The estimate is then polished with polish Gauss-Newton 
+        steps using exact moments and the Jacobian of the spline (updated with Broyden's formula), so the 
+        model is solved polish+1 times.
+        A step is only kept if it reduces the exact distance.
+
+        """
+
+        from scipy.interpolate import RectBivariateSpline
+
+        par = self.par
+        surface = self.surface
+        opt = SimpleNamespace()
+        
+        if surface is None: raise ValueError('no moment surface, call build_moment_surface or load_moment_surface first')
+        
+        target = np.array([par.beta0_target,par.beta1_target])
+        splines = [RectBivariateSpline(surface.alpha_grid,surface.sigma_grid,m) for m in (surface.beta0,surface.beta1)]
+        bounds = [(surface.alpha_grid[0],surface.alpha_grid[-1]),(surface.sigma_grid[0],surface.sigma_grid[-1])]
+
+        def moments(x):
+            return np.array([spline(*x,grid=False) for spline in splines])
+
+        def jacobian(x):
+            return np.array([[spline(*x,dx=1,grid=False),spline(*x,dy=1,grid=False)] for spline in splines])
+
+        def objective(x):
+            r = moments(x)-target
+            return r@r, 2*jacobian(x).T@r
+
+        # a. best grid point
+        values = (surface.beta0-target[0])**2 + (surface.beta1-target[1])**2
+        i,j = np.unravel_index(np.nanargmin(values),values.shape)
+        x0 = np.array([surface.alpha_grid[i],surface.sigma_grid[j]])
+
+        # b. minimize on the interpolant
+        res = optimize.minimize(objective,x0,jac=True,method='L-BFGS-B',bounds=bounds,options={'ftol':1e-15,'gtol':1e-12})
+        x = res.x
+
+        # c. polish with exact solves
+        def exact(x):
+            r = np.array(self.calc_moments(*x,discrete=surface.discrete))-target
+            return r,r@r
+
+        r,value = exact(x)
+        J = jacobian(x)
+        opt.nsolve = 1
+        for _ in range(polish):
+            dx = -np.linalg.lstsq(J,r,rcond=None)[0]
+            r_new,value_new = exact(x+dx)
+            opt.nsolve += 1
+            if not value_new < value: break
+            J += np.outer(r_new-r-J@dx,dx)/(dx@dx) # Broyden update with the exact moments
+            x,r,value = x+dx,r_new,value_new
+
+        opt.alpha,opt.sigma = x
+        opt.value = value
+        par.alpha,par.sigma = opt.alpha,opt.sigma
+
+        if do_print:
+            for k in ['alpha','sigma']:
+                print(f'optimal {k} = {getattr(opt,k):6.4f}')
 
         return opt
-    
\ No newline at end of file
+
+
+def _code_version():
+    """ hash of this file, used to invalidate stored solutions when the model changes """
+
+    with open(__file__,'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()[:16]
+
+def _solve_wF_chunk(par,wF,discrete):
+    """ solve model for a chunk of female wages (run by worker processes) """
+
+    model = HouseholdSpecializationModelClass()
+    model.par = par
+    res = model.solve_batch(wF=wF,discrete=discrete)
+
+    return np.array([res.LM,res.HM,res.LF,res.HF])
+
+def _calc_moments(par,alpha,sigma,discrete):
+    """ calculate moments for a grid point (run by worker processes) """
+
+    model = HouseholdSpecializationModelClass()
+    model.par = par
+
+    return model.calc_moments(alpha,sigma,discrete=discrete)
@@ -0,0 +1,93 @@
+import hashlib
+import io
+import sqlite3
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+class SolutionCache:
+
+    def __init__(self,path,version,max_bytes=2**30):
+        """ persistent cache of solutions in an SQLite file
+
+        Entries are namespaces of numbers and arrays stored as .npz blobs. Entries
+        written by another version of the model code are removed when the cache is opened,
+        and the least recently used entries are removed when the cache exceeds max_bytes.
+
+        """
+
+        self.path = path
+        self.version = version
+        self.max_bytes = max_bytes
+        self._con = None
+
+        con = self.connect()
+        con.execute('CREATE TABLE IF NOT EXISTS solutions (key TEXT PRIMARY KEY, version TEXT, value BLOB, size INTEGER, last_access REAL)')
+        con.execute('DELETE FROM solutions WHERE version != ?',(version,))
+        con.commit()
+
+    def connect(self):
+        """ connect to the SQLite file (once per process) """
+
+        if self._con is None:
+            self._con = sqlite3.connect(self.path,timeout=60)
+
+        return self._con
+
+    def __getstate__(self):
+        """ connections cannot be pickled, so worker processes reconnect """
+
+        state = self.__dict__.copy()
+        state['_con'] = None
+
+        return state
+
+    def key(self,*parts):
+        """ hash of the parts together with the code version """
+
+        return hashlib.sha256(repr((self.version,)+parts).encode()).hexdigest()
+
+    def get(self,key):
+        """ look up key, returns None if it is not in the cache """
+
+        con = self.connect()
+        row = con.execute('SELECT value FROM solutions WHERE key = ?',(key,)).fetchone()
+        if row is None: return None
+
+        con.execute('UPDATE solutions SET last_access = ? WHERE key = ?',(time.time(),key))
+        con.commit()
+
+        with np.load(io.BytesIO(row[0]),allow_pickle=False) as f:
+            return SimpleNamespace(**{k:f[k][()] if f[k].ndim == 0 else f[k] for k in f.files})
+
+    def put(self,key,value):
+        """ store namespace under key and evict least recently used entries if needed """
+
+        buf = io.BytesIO()
+        np.savez(buf,**{k:np.asarray(v) for k,v in vars(value).items()})
+        blob = buf.getvalue()
+
+        con = self.connect()
+        con.execute('INSERT OR REPLACE INTO solutions VALUES (?,?,?,?,?)',(key,self.version,blob,len(blob),time.time()))
+
+        size = con.execute('SELECT COALESCE(SUM(size),0) FROM solutions').fetchone()[0]
+        if size > self.max_bytes:
+            for key_,size_ in con.execute('SELECT key,size FROM solutions ORDER BY last_access').fetchall():
+                if size <= self.max_bytes: break
+                con.execute('DELETE FROM solutions WHERE key = ?',(key_,))
+                size -= size_
+
+        con.commit()
+
+    def size(self):
+        """ number of entries and their total size in bytes """
+
+        return self.connect().execute('SELECT COUNT(*),COALESCE(SUM(size),0) FROM solutions').fetchone()
+
+    def clear(self):
+        """ remove all entries """
+
+        con = self.connect()
+        con.execute('DELETE FROM solutions')
+        con.commit()
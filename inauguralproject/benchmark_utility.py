@@ -0,0 +1,65 @@
+""" benchmark of calc_utility: the original formula vs the kernels for each sigma regime
+
+run as: python benchmark_utility.py [N ...]
+"""
+
+import sys
+import time
+import warnings
+
+import numpy as np
+
+from HouseholdSpecializationModel import HouseholdSpecializationModelClass
+
+def _best_time(func, repeats):
+    """ best wall time of func over repeats calls """
+
+    timings = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        func()
+        timings.append(time.perf_counter()-t0)
+
+    return min(timings)
+
+def run(N_values=(100,1000,3000), sigmas=(0.0,0.1,0.5,1.0,1.5), repeats=5):
+
+    model = HouseholdSpecializationModelClass()
+    par = model.par
+
+    print(f'{"N":>6s} {"sigma":>6s} {"reference [Mpts/s]":>19s} {"float64 [Mpts/s]":>17s} {"float32 [Mpts/s]":>17s} {"max rel. err. float32":>22s}')
+    for N in N_values:
+
+        # N x N grid of male and female choices as in the discrete solver
+        rng = np.random.default_rng(1986)
+        LM,HM,LF,HF = [rng.uniform(0,12,N) for _ in range(4)]
+        LM,HM = LM[:,np.newaxis],HM[:,np.newaxis]
+        LF,HF = LF[np.newaxis,:],HF[np.newaxis,:]
+        LM32,HM32,LF32,HF32 = [x.astype(np.float32) for x in (LM,HM,LF,HF)]
+
+        out = np.empty((N,N))
+        tmp = np.empty((N,N))
+        out32 = np.empty((N,N),dtype=np.float32)
+        tmp32 = np.empty((N,N),dtype=np.float32)
+
+        for sigma in sigmas:
+
+            par.sigma = sigma
+            with warnings.catch_warnings(): # zero hours give infinite powers when sigma < 1
+                warnings.simplefilter('ignore', RuntimeWarning)
+
+                u_ref = model._calc_utility_scalar(LM,HM,LF,HF)
+                u = model.calc_utility(LM,HM,LF,HF,out=out,tmp=tmp)
+                u32 = model.calc_utility(LM32,HM32,LF32,HF32,out=out32,tmp=tmp32,dtype=np.float32)
+                assert np.array_equal(u_ref,u)
+
+                time_ref = _best_time(lambda: model._calc_utility_scalar(LM,HM,LF,HF),repeats)
+                time_64 = _best_time(lambda: model.calc_utility(LM,HM,LF,HF,out=out,tmp=tmp),repeats)
+                time_32 = _best_time(lambda: model.calc_utility(LM32,HM32,LF32,HF32,out=out32,tmp=tmp32,dtype=np.float32),repeats)
+
+            err = np.max(np.abs(u32-u)/np.fmax(np.abs(u),1e-8))
+            print(f'{N:6d} {sigma:6.2f} {N*N/time_ref/1e6:19.1f} {N*N/time_64/1e6:17.1f} {N*N/time_32/1e6:17.1f} {err:22.1e}')
+
+if __name__ == '__main__':
+    N_values = [int(float(N)) for N in sys.argv[1:]] or (100,1000,3000)
+    run(N_values)
@@ -1,8 +1,10 @@
+import copy
+import functools
+from concurrent.futures import ProcessPoolExecutor
+
 from scipy import optimize
 import numpy as np
-import matplotlib.pyplot as plt
 from types import SimpleNamespace
-import ipywidgets as widgets
 
 
 class StackelbergDuopoly:
@@ -30,8 +32,97 @@ class StackelbergDuopoly:
         res = optimize.minimize(lambda q2: -self.profit_l(q1, q2), x0=0, bounds=[(0, np.inf)], method='Nelder-Mead')
         return res.x[0]
 
+    # Closed form reaction of follower with linear demand, works on arrays
+    def best_response_f(self, q2):
+        return np.maximum((self.d - self.c**self.n - q2) / 2, 0)
+
+    # Derivative of follower profit with respect to own quantity (central difference with a step relative to q1)
+    def foc_f(self, q1, q2, h=1e-4):
+        h = h * (1 + np.abs(q1))
+        return (self.profit_f(q1 + h, q2) - self.profit_f(q1 - h, q2)) / (2 * h)
+
+    # Reaction of follower to an array of leader quantities by bisection on the first-order condition.
+    # The bracket is doubled until the condition is negative, so only profit_f is used and it also works
+    # for other (concave) profit functions.
+    def R_f_vec(self, q2, tol=1e-12, max_iter=200):
+        q2 = np.asarray(q2, dtype=float)
+        lo = np.zeros(np.shape(self.foc_f(0.0, q2)))
+        hi = lo + 1
+        for _ in range(max_iter):
+            I = self.foc_f(hi, q2) > 0
+            if not np.any(I):
+                break
+            lo = np.where(I, hi, lo)
+            hi = np.where(I, 2 * hi, hi)
+        for _ in range(max_iter):
+            mid = (lo + hi) / 2
+            I = self.foc_f(mid, q2) > 0
+            lo = np.where(I, mid, lo)
+            hi = np.where(I, hi, mid)
+            if np.all(hi - lo < tol):
+                break
+        return (lo + hi) / 2
+
+    # Leader quantity maximizing profit given the follower's reaction: grid search over [0,q_max] followed by
+    # golden section search. Without q_max the bound is doubled until the leader's profit decreases.
+    def _leader_numerical(self, q_max=None, num_grid=21, tol=1e-10, max_iter=200):
+        leader_profit = lambda q2: self.profit_l(self.R_f_vec(q2), q2)
+
+        # a. upper bound
+        if q_max is None:
+            q_max = np.ones(np.shape(self.profit_l(0.0, 0.0)))
+            for _ in range(max_iter):
+                h = 1e-4 * (1 + q_max)
+                I = leader_profit(q_max + h) > leader_profit(q_max - h)
+                if not np.any(I):
+                    break
+                q_max = np.where(I, 2 * q_max, q_max)
+        q_max = np.asarray(q_max, dtype=float)
+
+        # b. grid with an extra last axis
+        model = copy.copy(self)
+        model.c, model.d, model.n = [np.asarray(x)[..., np.newaxis] for x in (self.c, self.d, self.n)]
+        grid = q_max[..., np.newaxis] * np.linspace(0, 1, num_grid)
+        k = np.argmax(model.profit_l(model.R_f_vec(grid), grid), axis=-1)
+
+        # c. golden section search between the neighbouring grid points
+        step = q_max / (num_grid - 1)
+        lo = np.maximum((k - 1) * step, 0)
+        hi = np.minimum((k + 1) * step, q_max)
+        g = (np.sqrt(5) - 1) / 2
+        for _ in range(max_iter):
+            if np.all(hi - lo < tol):
+                break
+            x1 = hi - g * (hi - lo)
+            x2 = lo + g * (hi - lo)
+            I = leader_profit(x1) >= leader_profit(x2)
+            hi = np.where(I, x2, hi)
+            lo = np.where(I, lo, x1)
+        return (lo + hi) / 2
+
     # Get optimal quantities using backwards induction
-    def get_optimal_quantities(self):
+    def get_optimal_quantities(self, method='nelder-mead'):
+        """
+        Returns the follower and leader quantities (q1, q2).
+
+            method (str): 'nelder-mead' (nested numerical optimization),
+                          'analytic' (closed form with linear demand) or
+                          'numerical' (vectorized root-finding for the follower, any concave profit functions).
+                          'analytic' and 'numerical' work with arrays of c, d and n.
+        """
+        if method == 'analytic':
+            q2_opt = np.maximum(self.d - self.c**self.n, 0) / 2
+            q1_opt = self.best_response_f(q2_opt)
+            return q1_opt, q2_opt
+
+        if method == 'numerical':
+            q2_opt = self._leader_numerical()
+            q1_opt = self.R_f_vec(q2_opt)
+            return q1_opt, q2_opt
+
+        if method != 'nelder-mead':
+            raise ValueError(f'unknown method: {method}')
+
         # Step 1: Solve follower's reaction given any quantity produced by the leader
         def follower_reaction(q2):
             return self.R_f(q2)
@@ -50,7 +141,63 @@ class StackelbergDuopoly:
         return q1_opt, q2_opt
 
 
-def plot_optimal_quantities(n=1,c=0, d=20, c_min = 1, c_max = 20, num_points=500):
+def solve_equilibria(c, d, n, method='analytic'):
+    """
+    Solves the Stackelberg duopoly for arrays of parameters in one call.
+
+        Parameters:
+            c, d, n (float or array): parameters, broadcast against each other
+            method (str): see StackelbergDuopoly.get_optimal_quantities
+
+        Returns:
+            q1, q2 (arrays): quantities of the follower and the leader
+    """
+    c, d, n = np.broadcast_arrays(*[np.asarray(x, dtype=float) for x in (c, d, n)])
+
+    if method == 'nelder-mead':
+        q1, q2 = np.zeros(c.shape), np.zeros(c.shape)
+        for i in np.ndindex(c.shape):
+            q1[i], q2[i] = StackelbergDuopoly(c=c[i], d=d[i], n=n[i]).get_optimal_quantities()
+        return q1, q2
+
+    return StackelbergDuopoly(c=c, d=d, n=n).get_optimal_quantities(method=method)
+
+
+def solve_sweep(c_values, d_values, n_values, method='analytic', workers=None):
+    """
+    Solves the Stackelberg duopoly for a sweep of parameters.
+
+        Parameters:
+            c_values, d_values, n_values (float or array): parameters, broadcast against each other
+            method (str): see StackelbergDuopoly.get_optimal_quantities
+            workers (int): number of processes used for 'nelder-mead', which cannot be vectorized
+
+        Returns:
+            DataFrame with columns c, d, n, q_follower and q_leader (one row per parameter set)
+    """
+    import pandas as pd
+
+    c, d, n = [x.ravel() for x in np.broadcast_arrays(*[np.asarray(x, dtype=float) for x in (c_values, d_values, n_values)])]
+
+    if method == 'nelder-mead' and workers is not None and workers > 1:
+        chunks = [np.array_split(x, 4 * workers) for x in (c, d, n)]
+        with ProcessPoolExecutor(workers) as pool:
+            res = list(pool.map(solve_equilibria, *chunks, [method] * len(chunks[0])))
+        q1 = np.concatenate([r[0] for r in res])
+        q2 = np.concatenate([r[1] for r in res])
+    else:
+        q1, q2 = solve_equilibria(c, d, n, method=method)
+
+    return pd.DataFrame({'c': c, 'd': d, 'n': n, 'q_follower': q1, 'q_leader': q2})
+
+
+# Sweeps are cached so that redrawing the plot for the same parameters does not solve the model again
+@functools.lru_cache(maxsize=128)
+def _cached_sweep(n, d, c_min, c_max, num_points, method):
+    return solve_sweep(np.linspace(c_min, c_max, num_points), d, n, method=method)
+
+
+def plot_optimal_quantities(n=1,c=0, d=20, c_min = 1, c_max = 20, num_points=500, method='analytic'):
     """
     Plots the Stackelberg duopoly quantities as a function of marginal costs.
 
@@ -61,42 +208,59 @@ def plot_optimal_quantities(n=1,c=0, d=20, c_min = 1, c_max = 20, num_points=500
             c_min (float): Where to start marginal cost
             c_max (float): Where to end marignal costs
             num_points (float): How many points to create in the plot 
+            method (str): solution method, see StackelbergDuopoly.get_optimal_quantities
 
         Returns:
             2d plot
     """
-    # Define the range of c values to consider
-    c_values = np.linspace(c_min, c_max, num_points)
-
-    # Initialize arrays to store the optimal quantities
-    qf_values = np.zeros_like(c_values)
-    ql_values = np.zeros_like(c_values)
+    import matplotlib.pyplot as plt
 
-    # Create a StackelbergDuopoly object with fixed parameters
-    model = StackelbergDuopoly(n=n, c=c, d=d)
-
-    # Compute the optimal quantities for each value of c
-    for i, c in enumerate(c_values):
-        model.c = c  # Update the value of c in the duopoly object
-        qf_opt, ql_opt = model.get_optimal_quantities()
-        qf_values[i] = qf_opt
-        ql_values[i] = ql_opt
+    # Compute (or look up) the optimal quantities for each value of c
+    sweep = _cached_sweep(n, d, c_min, c_max, int(num_points), method)
 
     # Plot the optimal quantities against the cost parameter c
-    plt.plot(c_values, qf_values, label='Quantity of follower')
-    plt.plot(c_values, ql_values, label='Quantity of leader')
+    plt.plot(sweep.c, sweep.q_follower, label='Quantity of follower')
+    plt.plot(sweep.c, sweep.q_leader, label='Quantity of leader')
     plt.xlabel('Marginal Cost')
     plt.ylabel('Quantity')
     plt.legend()
     plt.show()
 
-def interactive_plot():
+def interactive_plot(c_min=1, c_max=20, num_points=500, method='analytic'):
+    """
+    Interactive version of plot_optimal_quantities.
+
+    The sliders only update when released, sweeps are looked up in the cache used by
+    plot_optimal_quantities, and the same figure is redrawn with the new data.
+    """
+    import matplotlib.pyplot as plt
+    import ipywidgets as widgets
+    from IPython.display import display, clear_output
+
+    sliders = dict(n = widgets.FloatSlider(min=0.1, max=10, value=2, description='n', continuous_update=False),
+                   d = widgets.FloatSlider(min=1, max=100, value=20, description='d', continuous_update=False),
+                   c = widgets.FloatSlider(min=1, max=20, value=2, description='c', continuous_update=False))
 
-    widgets.interact(plot_optimal_quantities,
-                     n = widgets.FloatSlider(min=0.1, max=10, value=2, description='n'),
-                     d = widgets.FloatSlider(min=1, max=100, value=20, description='d'),
-                     c = widgets.FloatSlider(min=1, max=20, value=2, description='c'),
+    # Create the figure once
+    with plt.ioff():
+        fig, ax = plt.subplots()
+    line_f, = ax.plot([], [], label='Quantity of follower')
+    line_l, = ax.plot([], [], label='Quantity of leader')
+    ax.set_xlabel('Marginal Cost')
+    ax.set_ylabel('Quantity')
+    ax.legend()
+    out = widgets.Output()
 
-    
+    # Update the lines in place and redraw
+    def update(n, d, c):
+        sweep = _cached_sweep(n, d, c_min, c_max, int(num_points), method)
+        line_f.set_data(sweep.c, sweep.q_follower)
+        line_l.set_data(sweep.c, sweep.q_leader)
+        ax.relim()
+        ax.autoscale_view()
+        with out:
+            clear_output(wait=True)
+            display(fig)
 
-);
+    widgets.interactive_output(update, sliders)
+    display(widgets.VBox([widgets.HBox(list(sliders.values())), out]))